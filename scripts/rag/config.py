@@ -1,3 +1,5 @@
+import os
+
 # ----------------------------
 # File processing config
 # ----------------------------
@@ -5,6 +7,17 @@ DEFAULT_INCLUDE_EXTS = {".ts", ".tsx", ".js", ".jsx", ".css", ".scss", ".sass",
 DEFAULT_EXCLUDE_DIRS = {".git", "node_modules", "dist", "build", ".next", "out", "__pycache__", ".turbo", ".cache"}
 DEFAULT_EXCLUDE_EXTS = {".lock", ".log", ".png", ".jpg", ".jpeg", ".gif", ".svg", ".ico", ".map", ".stories"}
 
+# Files larger than this are skipped (lockfiles, minified bundles, generated code)
+MAX_FILE_BYTES = 512 * 1024
+# Leading bytes inspected for NUL bytes to detect binary files
+BINARY_SNIFF_BYTES = 4096
+
+# Files are parsed in a process pool of this size when there are at least PARALLEL_MIN_FILES
+BUILD_MAX_WORKERS = os.cpu_count() or 1
+PARALLEL_MIN_FILES = 64
+# Files sent to a worker per task; most source files parse in well under a millisecond
+BUILD_CHUNKSIZE = 32
+
 # Directories to exclude from src folder (extends default exclude dirs)
 SRC_EXCLUDE_DIRS = DEFAULT_EXCLUDE_DIRS.copy()
 SRC_EXCLUDE_DIRS.update(["icons", "images", "assets", "fonts", "static", "public"])
@@ -14,6 +27,42 @@ SRC_EXCLUDE_DIRS.update(["icons", "images", "assets", "fonts", "static", "public
 # ----------------------------
 DEFAULT_DB_DIR = ".chroma"
 
+# HNSW index parameters, applied when the collection is first created.
+# The corpus is small and built once, so a slower, higher-recall build is cheap.
+HNSW_SPACE = "cosine"
+HNSW_CONSTRUCTION_EF = 300
+HNSW_M = 16
+# Query-time search breadth (ef_search) per --ann-profile: higher means better recall, slower queries
+ANN_PROFILES = {"fast": 20, "balanced": 64, "recall-max": 200}
+DEFAULT_ANN_PROFILE = "balanced"
+
+# Embedding ingestion: texts per embedding request and concurrent requests
+EMBED_BATCH_SIZE = 512
+EMBED_MAX_WORKERS = 8
+# Chunks handed to the vector store per add_documents call during ingest
+INGEST_BATCH_SIZE = 1000
+# Batches buffered between the splitter and the database writer
+INGEST_QUEUE_BATCHES = 2
+# Documents passed to a splitter per split_documents call while streaming
+SPLIT_BATCH_SIZE = 64
+# Client-side cap on embedding requests, kept under the API rate limit, and retries per request
+EMBED_REQUESTS_PER_MINUTE = 3000
+EMBED_MAX_RETRIES = 3
+# SQLite cache of embeddings keyed by content hash, stored inside the DB directory
+EMBED_CACHE_FILE = "embedding_cache.sqlite3"
+# Per-file fingerprints from the last ingest, used to skip unchanged files
+MANIFEST_FILE = "manifest.json"
+# LLM analyses of example projects, keyed by README + package.json + model, stored inside the DB directory
+EXAMPLE_ANALYSIS_CACHE_DIR = "example_analysis"
+# Components extracted from source files, keyed by file content, stored inside the DB directory;
+# bump the version when extraction changes
+COMPONENT_CACHE_FILE = "component_cache.sqlite3"
+COMPONENT_CACHE_VERSION = 5
+# Source files larger than this skip Tree-sitter and use regex export extraction
+AST_MAX_BYTES = 256 * 1024
+# Example projects processed concurrently (LLM analysis + file reads)
+EXAMPLE_MAX_WORKERS = 8
+
 # ----------------------------
 # Chunking config
 # ----------------------------
@@ -37,9 +86,33 @@ EXAMPLE_CHUNK_OVERLAP = 1000
 EMBEDDING_MODEL = "text-embedding-3-large"
 LLM_MODEL = "gpt-4o-mini"
 LLM_TEMPERATURE = 0
+# One keep-alive HTTP/2 client is shared by every OpenAI chat and embedding client
+HTTP_MAX_CONNECTIONS = 50
+HTTP_TIMEOUT_SECONDS = 30
 
 # Retriever config
 RETRIEVER_K = 20
+# Vector search fetches this many times k, so dropping identical chunks still leaves k results
+DUPLICATE_OVERFETCH = 2
+
+# Lexical (BM25) index over all chunks, pickled inside the DB directory at ingest; bump the
+# version when the pickled retriever changes shape so stale indexes are rebuilt, not loaded
+BM25_INDEX_FILE = "bm25.pkl"
+BM25_INDEX_VERSION = 1
+# Chunks read from the collection per request while building the BM25 index
+BM25_LOAD_PAGE_SIZE = 5000
+# Reciprocal Rank Fusion constant: score = sum(1 / (RRF_K + rank))
+RRF_K = 60
+
+# Semantic query cache: reuse results for queries whose embeddings are this similar
+QUERY_CACHE_SIMILARITY = 0.95
+QUERY_CACHE_MAX_ENTRIES = 256
+QUERY_CACHE_TTL_SECONDS = 3600
+
+# Answer cache: persisted answers reused for near-identical questions (cosine distance)
+ANSWER_CACHE_COLLECTION = "answer_cache"
+ANSWER_CACHE_MAX_DISTANCE = 0.15
+ANSWER_CACHE_TTL_SECONDS = 7 * 24 * 3600
 
 # Display configuration
 TOP_COMPONENT_COUNT = 15
@@ -5,65 +5,524 @@ This module provides a clean interface for vector database operations,
 making it easy to switch between different vector stores (Chroma, Pinecone, etc.)
 """
 
-from typing import List, Dict, Any, Optional
+import functools
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import uuid
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
 from pathlib import Path
 
+import numpy as np
+
 from langchain_openai import OpenAIEmbeddings
 from langchain_chroma import Chroma
+from langchain_community.retrievers import BM25Retriever
 from langchain.schema import Document
 from langchain.schema.embeddings import Embeddings
 
-from utils import LOG
-from config import EMBEDDING_MODEL, RETRIEVER_K
+from utils import LOG, Manifest, RateLimiter, batched, get_http_client
+from config import (
+    EMBEDDING_MODEL, RETRIEVER_K, EMBED_BATCH_SIZE, EMBED_MAX_WORKERS, EMBED_CACHE_FILE,
+    EMBED_REQUESTS_PER_MINUTE, EMBED_MAX_RETRIES,
+    HNSW_SPACE, HNSW_CONSTRUCTION_EF, HNSW_M, ANN_PROFILES, DEFAULT_ANN_PROFILE,
+    QUERY_CACHE_SIMILARITY, QUERY_CACHE_MAX_ENTRIES, QUERY_CACHE_TTL_SECONDS,
+    ANSWER_CACHE_COLLECTION, ANSWER_CACHE_MAX_DISTANCE, ANSWER_CACHE_TTL_SECONDS,
+    MANIFEST_FILE, BM25_INDEX_FILE, BM25_INDEX_VERSION, BM25_LOAD_PAGE_SIZE, DUPLICATE_OVERFETCH
+)
+
+
+# SQLite caps the number of bound parameters per statement
+SQLITE_MAX_PARAMS = 500
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that persists document vectors in SQLite keyed by content hash"""
+    
+    def __init__(self, underlying: Embeddings, model: str, cache_path: str,
+                 rate_limiter: Optional[RateLimiter] = None):
+        self.underlying = underlying
+        self.model = model
+        self.rate_limiter = rate_limiter
+        Path(cache_path).parent.mkdir(parents=True, exist_ok=True)
+        # Batches are embedded from worker threads; a lock serializes access
+        self._conn = sqlite3.connect(cache_path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+    
+    def _key(self, text: str) -> bytes:
+        return hashlib.sha256(f"{self.model}\0{text}".encode("utf-8")).digest()
+    
+    def _lookup(self, keys: List[bytes]) -> Dict[bytes, List[float]]:
+        found: Dict[bytes, List[float]] = {}
+        with self._lock:
+            for batch in batched(keys, SQLITE_MAX_PARAMS):
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                )
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+        return found
+    
+    def _store(self, vectors: Dict[bytes, List[float]]) -> None:
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, array("f", vec).tobytes()) for key, vec in vectors.items()],
+            )
+            self._conn.commit()
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts, calling the underlying model only for cache misses"""
+        keys = [self._key(t) for t in texts]
+        vectors = self._lookup(list(set(keys)))
+        missing: Dict[bytes, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors:
+                missing.setdefault(key, text)
+        
+        LOG.debug(f"Embedding cache: {len(texts) - len(missing)} hits, {len(missing)} misses")
+        if missing:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            computed = dict(zip(missing, self.underlying.embed_documents(list(missing.values()))))
+            self._store(computed)
+            vectors.update(computed)
+        return [vectors[key] for key in keys]
+    
+    def embed_query(self, text: str) -> List[float]:
+        """Queries are not cached; delegate to the underlying model"""
+        return self.underlying.embed_query(text)
+
+
+def document_ids(documents: List[Document]) -> List[str]:
+    """Deterministic IDs from each chunk's source path and line range
+    
+    IDs don't depend on how documents are batched, and re-ingesting a file overwrites
+    its rows instead of adding duplicates.
+    """
+    ids = []
+    seen: Dict[str, int] = {}
+    for d in documents:
+        source = d.metadata.get("path") or d.metadata.get("relpath")
+        if d.id or source is None:
+            ids.append(d.id or str(uuid.uuid4()))
+            continue
+        key = f"{source}:{d.metadata.get('start_line')}:{d.metadata.get('end_line')}"
+        # Unsplit documents have no line range; disambiguate repeats within a call
+        repeat = seen.get(key, 0)
+        seen[key] = repeat + 1
+        if repeat:
+            key = f"{key}:{repeat}"
+        ids.append(hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest())
+    return ids
+
+
+def chroma_metadata(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """Metadata as Chroma stores it: sequence values (e.g. components) become ", "-joined strings"""
+    if not any(isinstance(v, (list, tuple)) for v in metadata.values()):
+        return metadata
+    return {k: ", ".join(v) if isinstance(v, (list, tuple)) else v for k, v in metadata.items()}
+
+
+def content_hash(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+def dedupe_by_content(documents: List[Document]) -> List[Document]:
+    """Keep the first of each group of documents with identical content, preserving order"""
+    seen = set()
+    unique = []
+    for d in documents:
+        h = content_hash(d.page_content)
+        if h not in seen:
+            seen.add(h)
+            unique.append(d)
+    return unique
+
+
+class SemanticQueryCache:
+    """LRU + TTL cache of search results, matched by cosine similarity of query embeddings"""
+    
+    def __init__(self, threshold: float = QUERY_CACHE_SIMILARITY,
+                 max_entries: int = QUERY_CACHE_MAX_ENTRIES, ttl: float = QUERY_CACHE_TTL_SECONDS):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[int, Tuple[Tuple, np.ndarray, float, Any]]" = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _normalize(vector: List[float]) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(v)
+        return v / norm if norm else v
+    
+    def get(self, key: Tuple, vector: List[float]) -> Optional[Any]:
+        """Return the cached result for the most similar query with the same key, if close enough"""
+        q = self._normalize(vector)
+        now = time.monotonic()
+        with self._lock:
+            for entry_id in [i for i, e in self._entries.items() if now - e[2] > self.ttl]:
+                del self._entries[entry_id]
+            candidates = [(i, e) for i, e in self._entries.items() if e[0] == key]
+            if not candidates:
+                return None
+            sims = np.stack([e[1] for _, e in candidates]) @ q
+            best = int(np.argmax(sims))
+            if sims[best] < self.threshold:
+                return None
+            entry_id, entry = candidates[best]
+            self._entries.move_to_end(entry_id)
+            LOG.debug(f"Query cache hit (cosine={sims[best]:.3f})")
+            return entry[3]
+    
+    def put(self, key: Tuple, vector: List[float], result: Any) -> None:
+        with self._lock:
+            self._entries[self._next_id] = (key, self._normalize(vector), time.monotonic(), result)
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class AnswerCache:
+    """Persistent cache of answers keyed by question embedding, kept in its own Chroma collection"""
+    
+    def __init__(self, db_dir: str, embeddings: Embeddings):
+        self.db_dir = db_dir
+        self.embeddings = embeddings
+        self._store = None
+    
+    @property
+    def store(self) -> Chroma:
+        if self._store is None:
+            self._store = Chroma(
+                collection_name=ANSWER_CACHE_COLLECTION,
+                persist_directory=self.db_dir,
+                embedding_function=self.embeddings,
+                collection_metadata={"hnsw:space": "cosine"},
+            )
+        return self._store
+    
+    @staticmethod
+    def guard_tokens(question: str) -> str:
+        """Paths and capitalized names in the question; a cached answer must match these exactly
+        
+        Embeddings of "Button props" and "Card props" are very close, but the answers are not.
+        """
+        words = [w.strip(".,;:?!'\"`()") for w in question.split()]
+        tokens = {
+            w for i, w in enumerate(words)
+            if w and ("/" in w or "." in w or (i > 0 and w[0].isupper()))
+        }
+        return " ".join(sorted(tokens))
+    
+    @staticmethod
+    def _key(method: str, ann_profile: Optional[str], fast: bool) -> Dict[str, Any]:
+        # Answers depend on how they were retrieved; Chroma metadata can't hold None
+        return {"method": method, "ann_profile": ann_profile or "", "fast": fast}
+    
+    def lookup(self, question: str, vector: List[float], method: str,
+               ann_profile: Optional[str] = None, fast: bool = False) -> Optional[str]:
+        """Return a fresh cached answer to an equivalent question retrieved the same way, if any"""
+        collection = self.store._collection
+        if collection.count() == 0:
+            return None
+        key = self._key(method, ann_profile, fast)
+        results = self.store.similarity_search_by_vector_with_relevance_scores(
+            vector, k=1, filter={"$and": [{name: value} for name, value in key.items()]}
+        )
+        if not results:
+            return None
+        doc, distance = results[0]
+        meta = doc.metadata
+        if distance > ANSWER_CACHE_MAX_DISTANCE:
+            return None
+        if time.time() - meta.get("ts", 0) > ANSWER_CACHE_TTL_SECONDS:
+            return None
+        if meta.get("guard", "") != self.guard_tokens(question):
+            return None
+        LOG.debug(f"Answer cache hit (distance={distance:.3f}): {doc.page_content}")
+        return meta.get("answer")
+    
+    def put(self, question: str, vector: List[float], method: str, answer: str,
+            ann_profile: Optional[str] = None, fast: bool = False) -> None:
+        self.store._collection.add(
+            ids=[str(uuid.uuid4())],
+            embeddings=[vector],
+            documents=[question],
+            metadatas=[{
+                "answer": answer,
+                **self._key(method, ann_profile, fast),
+                "guard": self.guard_tokens(question),
+                "ts": time.time(),
+            }],
+        )
+    
+    def clear(self) -> None:
+        """Drop all cached answers, e.g. after the index changes"""
+        try:
+            self.store.delete_collection()
+        except Exception as e:
+            LOG.debug(f"Could not delete answer cache: {e}")
+        self._store = None
+
+
+@functools.lru_cache(maxsize=4)
+def _get_embeddings(db_dir: str, embedding_model: str) -> CachedEmbeddings:
+    """Embeddings shared by all VectorDatabase instances for the same directory and model"""
+    return CachedEmbeddings(
+        OpenAIEmbeddings(model=embedding_model, chunk_size=EMBED_BATCH_SIZE, max_retries=EMBED_MAX_RETRIES,
+                         http_client=get_http_client()),
+        model=embedding_model,
+        cache_path=str(Path(db_dir) / EMBED_CACHE_FILE),
+        rate_limiter=RateLimiter(EMBED_REQUESTS_PER_MINUTE),
+    )
+
+
+@functools.lru_cache(maxsize=4)
+def _get_vectorstore(db_dir: str, embedding_model: str, search_ef: Optional[int]) -> Chroma:
+    """Chroma client shared by all VectorDatabase instances, so index metadata is loaded once
+    
+    ef_search is a property of the persisted collection, not of one query: a `search_ef`
+    that differs from the collection's is written to it and applies to every reader until
+    changed again. None keeps whatever the collection has.
+    """
+    vectorstore = Chroma(
+        persist_directory=db_dir,
+        embedding_function=_get_embeddings(db_dir, embedding_model),
+        collection_metadata={
+            "hnsw:space": HNSW_SPACE,
+            "hnsw:construction_ef": HNSW_CONSTRUCTION_EF,
+            "hnsw:M": HNSW_M,
+            "hnsw:search_ef": search_ef or ANN_PROFILES[DEFAULT_ANN_PROFILE],
+        },
+    )
+    if search_ef is None:
+        return vectorstore
+    # Collection metadata only applies at creation; ef_search is changed through the
+    # configuration API (Chroma >= 1.0), which leaves the metadata and its hnsw:space alone.
+    # A metadata update would replace the whole dict, and one that carries hnsw:space is rejected.
+    collection = vectorstore._collection
+    configuration = getattr(collection, "configuration", None) or {}
+    hnsw = configuration.get("hnsw") or {}
+    if hnsw.get("ef_search") == search_ef:
+        return vectorstore
+    try:
+        collection.modify(configuration={"hnsw": {"ef_search": search_ef}})
+    except TypeError:
+        LOG.warning(f"This Chroma version cannot change ef_search on an existing collection; "
+                    f"keeping {(collection.metadata or {}).get('hnsw:search_ef')} instead of {search_ef}")
+    except Exception as e:
+        LOG.warning(f"Could not set ef_search={search_ef} on existing collection: {e}")
+    return vectorstore
+
+
+@functools.lru_cache(maxsize=4)
+def _get_query_cache(db_dir: str) -> SemanticQueryCache:
+    """Search result cache shared by all VectorDatabase instances for a directory, so it outlives one query()"""
+    return SemanticQueryCache()
+
+
+# Written ahead of the pickled BM25 retriever, so an index from another version is never unpickled
+BM25_INDEX_HEADER = b"bm25-index v%d\n" % BM25_INDEX_VERSION
 
 
 class VectorDatabase:
     """Abstract interface for vector database operations"""
     
-    def __init__(self, db_dir: str = ".chroma", embedding_model: str = None):
+    def __init__(self, db_dir: str = ".chroma", embedding_model: str = None, ann_profile: str = None):
         self.db_dir = db_dir
         self.embedding_model = embedding_model or EMBEDDING_MODEL
+        # No profile: search with the collection's current ef_search and leave it unchanged
+        self.search_ef = ANN_PROFILES[ann_profile] if ann_profile else None
         self._embeddings = None
         self._vectorstore = None
+        self._query_cache = _get_query_cache(db_dir)
+        self._answer_cache = None
+        self._lexical_retriever = None
     
     @property
     def embeddings(self) -> Embeddings:
-        """Get or create embeddings instance"""
+        """Get the shared embeddings instance, backed by the on-disk embedding cache"""
         if self._embeddings is None:
-            self._embeddings = OpenAIEmbeddings(model=self.embedding_model)
+            self._embeddings = _get_embeddings(self.db_dir, self.embedding_model)
         return self._embeddings
     
     @property
     def vectorstore(self) -> Chroma:
-        """Get or create vector store instance"""
+        """Get the shared vector store instance for this database directory"""
         if self._vectorstore is None:
-            self._vectorstore = Chroma(
-                persist_directory=self.db_dir,
-                embedding_function=self.embeddings,
-            )
+            self._vectorstore = _get_vectorstore(self.db_dir, self.embedding_model, self.search_ef)
         return self._vectorstore
     
+    @property
+    def answer_cache(self) -> AnswerCache:
+        """Get the persistent answer cache stored alongside this database"""
+        if self._answer_cache is None:
+            self._answer_cache = AnswerCache(self.db_dir, self.embeddings)
+        return self._answer_cache
+    
     def add_documents(self, documents: List[Document]) -> None:
-        """Add documents to the vector store"""
+        """Add documents to the vector store, embedding batches concurrently
+        
+        Documents with identical content are embedded once and share the vector.
+        """
         if not documents:
             LOG.warning("No documents to add")
             return
         
         LOG.info(f"Adding {len(documents)} documents to vector store")
-        self.vectorstore.add_documents(documents)
+        groups: Dict[bytes, List[Tuple[str, Document]]] = {}
+        for doc_id, d in zip(document_ids(documents), documents):
+            groups.setdefault(content_hash(d.page_content), []).append((doc_id, d))
+        if len(groups) < len(documents):
+            LOG.info(f"Embedding {len(groups)} unique texts ({len(documents) - len(groups)} duplicates)")
+        
+        embeddings = self.embeddings
+        batches = list(batched(list(groups.values()), EMBED_BATCH_SIZE))
+        workers = min(EMBED_MAX_WORKERS, len(batches))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # map() yields in submission order, so writes stay on this thread
+            # while later batches are still being embedded
+            vectors = executor.map(
+                lambda batch: embeddings.embed_documents([group[0][1].page_content for group in batch]),
+                batches,
+            )
+            for i, (batch, batch_vectors) in enumerate(zip(batches, vectors), 1):
+                ids = [doc_id for group in batch for doc_id, _ in group]
+                docs = [d for group in batch for _, d in group]
+                doc_vectors = [v for group, v in zip(batch, batch_vectors) for _ in group]
+                self.add_documents_with_embeddings(docs, doc_vectors, ids=ids)
+                LOG.debug(f"Upserted batch {i}/{len(batches)} ({len(docs)} documents)")
+        self._query_cache.clear()
         LOG.info("Documents added successfully")
     
+    def add_documents_with_embeddings(self, documents: List[Document], vectors: List[List[float]],
+                                      ids: Optional[List[str]] = None) -> None:
+        """Write documents with precomputed embeddings in a single upsert"""
+        self.vectorstore._collection.upsert(
+            ids=ids or document_ids(documents),
+            embeddings=vectors,
+            documents=[d.page_content for d in documents],
+            metadatas=[chroma_metadata(d.metadata) for d in documents],
+        )
+    
+    def delete_paths(self, paths: List[str]) -> None:
+        """Delete all chunks whose source file is one of `paths`"""
+        paths = list(paths)
+        LOG.info(f"Deleting chunks for {len(paths)} files from vector store")
+        for batch in batched(paths, SQLITE_MAX_PARAMS):
+            self.vectorstore._collection.delete(where={"path": {"$in": batch}})
+        self._query_cache.clear()
+    
     def similarity_search(self, query: str, k: int = None) -> List[Document]:
-        """Perform similarity search"""
+        """Perform similarity search, reusing results of semantically equivalent queries"""
+        return self.search_by_vector(self.embeddings.embed_query(query), k=k)
+    
+    def search_by_vector(self, vector: List[float], k: int = None,
+                         filter: Optional[Dict[str, Any]] = None) -> List[Document]:
+        """Perform similarity search with a precomputed query embedding and optional metadata filter
+        
+        Results are reused for semantically equivalent queries with the same k, filter and ef_search.
+        """
         k = k or RETRIEVER_K
-        LOG.debug(f"Performing similarity search with k={k}")
-        return self.vectorstore.similarity_search(query, k=k)
+        key = ("docs", k, self.search_ef, json.dumps(filter, sort_keys=True) if filter else None)
+        cached = self._query_cache.get(key, vector)
+        if cached is not None:
+            return cached
+        LOG.debug(f"Performing similarity search by vector with k={k}, filter={filter}")
+        # Over-fetch so that dropping identical chunks from other files still leaves k results
+        docs = self.vectorstore.similarity_search_by_vector(vector, k=k * DUPLICATE_OVERFETCH, filter=filter)
+        docs = dedupe_by_content(docs)[:k]
+        self._query_cache.put(key, vector, docs)
+        return docs
     
     def similarity_search_with_score(self, query: str, k: int = None) -> List[tuple]:
-        """Perform similarity search with scores"""
+        """Perform similarity search with scores, reusing results of semantically equivalent queries"""
         k = k or RETRIEVER_K
+        vector = self.embeddings.embed_query(query)
+        cached = self._query_cache.get(("scored", k, self.search_ef), vector)
+        if cached is not None:
+            return cached
         LOG.debug(f"Performing similarity search with scores, k={k}")
-        return self.vectorstore.similarity_search_with_score(query, k=k)
+        results = self.vectorstore.similarity_search_by_vector_with_relevance_scores(vector, k=k)
+        self._query_cache.put(("scored", k, self.search_ef), vector, results)
+        return results
+    
+    def _iter_collection_documents(self):
+        """Every chunk in the collection, read a page at a time so large stores are not loaded in one call"""
+        collection = self.vectorstore._collection
+        offset = 0
+        while True:
+            data = collection.get(include=["documents", "metadatas"], limit=BM25_LOAD_PAGE_SIZE, offset=offset)
+            texts = data["documents"]
+            for text, meta in zip(texts, data["metadatas"]):
+                yield Document(page_content=text, metadata=meta or {})
+            if len(texts) < BM25_LOAD_PAGE_SIZE:
+                return
+            offset += len(texts)
+    
+    def build_lexical_index(self) -> None:
+        """Rebuild the BM25 index from every chunk in the collection and pickle it
+        
+        BM25 term weights depend on the whole corpus, so the index is always rebuilt in full.
+        The pickle is prefixed with a version header that is checked before unpickling.
+        """
+        docs = list(self._iter_collection_documents())
+        path = Path(self.db_dir) / BM25_INDEX_FILE
+        if not docs:
+            path.unlink(missing_ok=True)
+            return
+        LOG.info(f"Building BM25 index over {len(docs)} chunks")
+        retriever = BM25Retriever.from_documents(docs, k=RETRIEVER_K)
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            f.write(BM25_INDEX_HEADER)
+            pickle.dump(retriever, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        self._lexical_retriever = retriever
+    
+    def has_lexical_index(self) -> bool:
+        """Whether a BM25 index of the current version is saved, without unpickling it"""
+        path = Path(self.db_dir) / BM25_INDEX_FILE
+        try:
+            with open(path, "rb") as f:
+                return f.read(len(BM25_INDEX_HEADER)) == BM25_INDEX_HEADER
+        except OSError:
+            return False
+    
+    @property
+    def lexical_retriever(self) -> Optional[BM25Retriever]:
+        """Get the BM25 retriever saved by the last ingest, or None if there is none"""
+        if self._lexical_retriever is None:
+            path = Path(self.db_dir) / BM25_INDEX_FILE
+            if path.exists():
+                try:
+                    with open(path, "rb") as f:
+                        if f.read(len(BM25_INDEX_HEADER)) != BM25_INDEX_HEADER:
+                            LOG.warning(f"BM25 index at {path} is from another version; re-run ingest to rebuild it")
+                            return None
+                        self._lexical_retriever = pickle.load(f)
+                except Exception as e:
+                    LOG.warning(f"Could not load BM25 index at {path}: {e}")
+        return self._lexical_retriever
     
     def get_retriever(self, search_kwargs: Optional[Dict[str, Any]] = None) -> Any:
         """Get a retriever instance"""
@@ -74,12 +533,40 @@ class VectorDatabase:
         LOG.debug(f"Creating retriever with kwargs: {kwargs}")
         return self.vectorstore.as_retriever(search_kwargs=kwargs)
     
-    def clear(self) -> None:
-        """Clear all documents from the vector store"""
+    def clear(self, where: Optional[Dict[str, Any]] = None) -> None:
+        """Clear documents from the vector store
+        
+        With a metadata filter (e.g. {"kind": "example"}) only matching chunks are deleted
+        and the index is kept; their files are dropped from the manifest so the next ingest
+        re-adds them, and the BM25 index and answer cache are refreshed. Without a filter
+        the whole database directory is removed.
+        """
+        self._query_cache.clear()
+        if where is not None:
+            LOG.info(f"Clearing vector store chunks matching {where}")
+            collection = self.vectorstore._collection
+            paths = {
+                meta["path"]
+                for meta in collection.get(where=where, include=["metadatas"])["metadatas"]
+                if meta and meta.get("path")
+            }
+            collection.delete(where=where)
+            manifest_path = Path(self.db_dir) / MANIFEST_FILE
+            if paths and manifest_path.exists():
+                Manifest(manifest_path, self.embedding_model).forget(paths)
+            self.build_lexical_index()
+            self.answer_cache.clear()
+            return
+        
         LOG.info("Clearing vector store")
-        # For Chroma, we need to delete the collection and recreate it
-        # This is a simple approach - in production you might want more sophisticated clearing
         import shutil
+        # Shared clients point at files that are about to be removed
+        _get_vectorstore.cache_clear()
+        _get_embeddings.cache_clear()
+        self._vectorstore = None
+        self._embeddings = None
+        self._answer_cache = None
+        self._lexical_retriever = None
         if Path(self.db_dir).exists():
             shutil.rmtree(self.db_dir)
             LOG.info(f"Removed database directory: {self.db_dir}")
@@ -101,6 +588,11 @@ class VectorDatabase:
 
 
 # Convenience function for creating database instances
-def create_database(db_dir: str = ".chroma", embedding_model: str = None) -> VectorDatabase:
-    """Create a new vector database instance"""
-    return VectorDatabase(db_dir=db_dir, embedding_model=embedding_model)
+def create_database(db_dir: str = ".chroma", embedding_model: str = None,
+                    ann_profile: str = None) -> VectorDatabase:
+    """Create a new vector database instance
+    
+    ann_profile ("fast", "balanced", "recall-max") trades query recall for latency. It sets
+    the collection's ef_search, which persists for later readers; None leaves it as is.
+    """
+    return VectorDatabase(db_dir=db_dir, embedding_model=embedding_model, ann_profile=ann_profile)
@@ -2,42 +2,85 @@
 Documentation processing and chunking utilities
 """
 
+import re
+from collections import Counter
 from pathlib import Path
-from typing import List, Dict, Set
+from typing import DefaultDict, List, Dict, Optional, Set
 
+import frontmatter
 from langchain.schema import Document
-from langchain.text_splitter import MarkdownHeaderTextSplitter
 
-from utils import LOG
+from utils import LOG, path_key, read_text_file
 from config import DOCS_CHUNK_CHARS, DOCS_CHUNK_OVERLAP
 
 # ----------------------------
 # Markdown page-by-page split
 # ----------------------------
+HEADER_PATTERN = re.compile(r"^(#{1,3})\s+(.+?)\s*#*\s*$")
+
 def split_markdown_by_headers(text: str) -> List[Document]:
-    # Split by H1/H2/H3; each section is a Document with header metadata
-    splitter = MarkdownHeaderTextSplitter(
-        headers_to_split_on=[("#", "h1"), ("##", "h2"), ("###", "h3")]
-    )
-    return splitter.split_text(text)
+    """Split by H1/H2/H3; each section is a Document with header and start_line metadata
+    
+    Sections with a heading but no body are dropped; their heading names stay in the
+    metadata of the sections nested under them.
+    """
+    sections: List[Document] = []
+    headers = {"h1": "", "h2": "", "h3": ""}
+    current: List[str] = []
+    start_line = 1
+    in_fence = False
+    # The first section has no heading line of its own
+    body_start = 0
+
+    def flush():
+        if "".join(current[body_start:]).strip():
+            sections.append(Document(
+                page_content="\n".join(current),
+                metadata={**headers, "start_line": start_line},
+            ))
+
+    for i, line in enumerate(text.splitlines(), 1):
+        # Lines starting with "#" inside fenced code blocks are not headers
+        if line.lstrip().startswith(("```", "~~~")):
+            in_fence = not in_fence
+        match = None if in_fence else HEADER_PATTERN.match(line)
+        if match:
+            flush()
+            level = len(match.group(1))
+            headers[f"h{level}"] = match.group(2)
+            for deeper in range(level + 1, 4):
+                headers[f"h{deeper}"] = ""
+            current = [line]
+            start_line = i
+            body_start = 1
+        else:
+            current.append(line)
+    flush()
+    return sections
 
 # ----------------------------
 # Documentation processing
 # ----------------------------
+def _clean_component(value) -> Optional[str]:
+    """Frontmatter values may be booleans or other YAML types; only non-empty strings name a component"""
+    return value if isinstance(value, str) and value else None
+
 def process_documentation_file(
     p: Path, 
     project_root: Path,
-    component_counts: Dict[str, int], 
-    component_files: Dict[str, Set[str]], 
+    component_counts: Counter, 
+    component_files: DefaultDict[str, Set[str]], 
     docs_stats: Dict[str, int]
 ) -> List[Document]:
     """Process a single documentation file and return Document instances"""
     docs = []
     
     try:
-        text = p.read_text(encoding="utf-8", errors="ignore")
+        text = read_text_file(p)
     except Exception:
         return docs
+    if text is None:
+        return docs
 
     ext = p.suffix.lower()
     if ext not in {".md", ".mdx"}:
@@ -47,23 +90,22 @@ def process_documentation_file(
     frontmatter_title = None
     frontmatter_description = None
     frontmatter_component = None
-    try:
-        import frontmatter
-        parsed = frontmatter.loads(text)
-        frontmatter_title = parsed.get('title')
-        frontmatter_description = parsed.get('description')
-        frontmatter_component = parsed.get('component')
-    except Exception:
-        pass
+    # Only pay for a YAML parse when the file opens with a frontmatter fence
+    if text.startswith(("---\n", "---\r\n")):
+        try:
+            parsed = frontmatter.loads(text)
+            frontmatter_title = parsed.get('title')
+            frontmatter_description = parsed.get('description')
+            frontmatter_component = parsed.get('component')
+        except Exception:
+            pass
     
     # For docs, only use frontmatter component (don't infer from headers)
-    comps = set()
-    if frontmatter_component and frontmatter_component is not True and frontmatter_component is not False:
-        comps.add(frontmatter_component)
+    component = _clean_component(frontmatter_component)
     
     # Metadata
     meta = {
-        "path": str(p.resolve()),
+        "path": path_key(p),
         "relpath": str(p.relative_to(project_root)),
         "kind": "docs",
         "ext": ext,
@@ -73,32 +115,25 @@ def process_documentation_file(
         "h2": "",
         "h3": "",
     }
-    if comps:
-        comp_list = sorted(comps)
-        # Use frontmatter component as primary if available (but not boolean values)
-        if frontmatter_component and frontmatter_component is not True and frontmatter_component is not False:
-            meta["component"] = frontmatter_component
-            meta["components"] = ", ".join(comp_list)  # Convert list to string for ChromaDB
-        else:
-            meta["component"] = comp_list[0]
-            meta["components"] = ", ".join(comp_list)  # Convert list to string for ChromaDB
-        relpath = str(p.relative_to(project_root))
-        for c in comp_list:
-            # Skip boolean values and other non-component names
-            if c is True or c is False or not isinstance(c, str):
-                continue
-            component_counts[c] = component_counts.get(c, 0) + 1
-            component_files.setdefault(c, set()).add(relpath)
+    if component:
+        meta["component"] = component
+        meta["components"] = (component,)  # Joined into a string for ChromaDB at write time
+        relpath = meta["relpath"]
+        component_counts[component] += 1
+        component_files[component].add(relpath)
     else:
         # Ensure components field is always present
-        meta["components"] = ""
+        meta["components"] = ()
     
-    # Create a single document for the entire file - let our chunking logic handle it
-    docs.append(Document(page_content=text, metadata=meta))
+    # One document per header section; oversized sections are split further downstream
+    for section in split_markdown_by_headers(text):
+        section_meta = dict(meta)
+        section_meta.update(section.metadata)
+        docs.append(Document(page_content=section.page_content, metadata=section_meta))
     
     # Stats
     docs_stats["pages"] = docs_stats.get("pages", 0) + 1
-    docs_stats["sections"] = docs_stats.get("sections", 0) + 1
+    docs_stats["sections"] = docs_stats.get("sections", 0) + len(docs)
     if frontmatter_title:
         docs_stats["titled_pages"] = docs_stats.get("titled_pages", 0) + 1
     
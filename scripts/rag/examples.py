@@ -6,19 +6,60 @@ quality by providing real working implementations with different build tools and
 """
 
 from pathlib import Path
-from typing import List, Dict, Any, Set
-import json
+from typing import List, Dict, Any, Set, Optional
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import orjson
 
 from langchain.schema import Document
 from langchain_openai import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
 
-from utils import LOG
-from config import EXAMPLE_CHUNK_CHARS, EXAMPLE_CHUNK_OVERLAP, DEFAULT_INCLUDE_EXTS, LLM_MODEL, LLM_TEMPERATURE
+from utils import LOG, Manifest, path_key, read_text_file, get_http_client
+from config import (
+    EXAMPLE_CHUNK_CHARS, EXAMPLE_CHUNK_OVERLAP, DEFAULT_INCLUDE_EXTS, DEFAULT_EXCLUDE_DIRS,
+    LLM_MODEL, LLM_TEMPERATURE, DEFAULT_DB_DIR, EXAMPLE_ANALYSIS_CACHE_DIR, EXAMPLE_MAX_WORKERS
+)
+
+# File selection, computed once: sources anywhere under src/ plus key files at the project root
+EXAMPLE_SOURCE_EXTS = frozenset(DEFAULT_INCLUDE_EXTS - {".json"})
+EXAMPLE_ROOT_FILES = frozenset({"package.json", "README.md"})
+
+# Generic file categorization by suffix (see get_file_type)
+SUFFIX_TO_TYPE = {
+    ".tsx": "react_component", ".jsx": "react_component",
+    ".ts": "typescript", ".js": "typescript",
+    ".css": "stylesheet", ".scss": "stylesheet", ".sass": "stylesheet",
+    ".md": "documentation", ".mdx": "documentation",
+    ".html": "html",
+    ".json": "configuration",
+}
 
+# File name or suffix -> (file_type, description template filled with the example type)
+EXAMPLE_FILE_KINDS = {
+    "package.json": ("dependencies", "Dependencies and scripts for {} example"),
+    ".tsx": ("implementation", "Implementation code for {} example"),
+    ".ts": ("implementation", "Implementation code for {} example"),
+    ".jsx": ("implementation", "Implementation code for {} example"),
+    ".js": ("implementation", "Implementation code for {} example"),
+    ".css": ("stylesheet", "Styling and CSS for {} example"),
+    ".scss": ("stylesheet", "Styling and CSS for {} example"),
+    ".sass": ("stylesheet", "Styling and CSS for {} example"),
+    ".md": ("documentation", "Documentation for {} example"),
+    ".mdx": ("documentation", "Documentation for {} example"),
+    ".html": ("html", "HTML template for {} example"),
+    ".json": ("configuration", "Build configuration for {} example"),
+}
 
-def analyze_example_with_llm(example_path: Path) -> Dict[str, Any]:
-    """Use LLM to analyze example project and extract metadata"""
+
+def analyze_example_with_llm(example_path: Path, db_dir: Optional[str] = None,
+                             dry_run: bool = False) -> Dict[str, Any]:
+    """Use LLM to analyze example project and extract metadata
+    
+    Analyses are cached under `db_dir`; dry runs read the cache but never write to it.
+    """
     # Read key files
     readme_content = ""
     package_json_content = ""
@@ -36,6 +77,18 @@ def analyze_example_with_llm(example_path: Path) -> Dict[str, Any]:
     if not readme_content and not package_json_content:
         raise ValueError(f"No README.md or package.json found in {example_path}")
     
+    # Reuse a previous analysis of identical inputs
+    cache_key = hashlib.sha256(
+        f"{readme_content}\0{package_json_content}\0{LLM_MODEL}".encode("utf-8")
+    ).hexdigest()
+    cache_path = Path(db_dir or DEFAULT_DB_DIR) / EXAMPLE_ANALYSIS_CACHE_DIR / f"{cache_key}.json"
+    if cache_path.exists():
+        try:
+            LOG.debug(f"Using cached analysis for {example_path}")
+            return orjson.loads(cache_path.read_bytes())
+        except Exception as e:
+            LOG.warning(f"Ignoring unreadable analysis cache {cache_path}: {e}")
+    
     # Create LLM prompt
     prompt = ChatPromptTemplate.from_messages([
         ("system", """You are an expert at analyzing React/JavaScript projects. 
@@ -66,8 +119,13 @@ Project name: {project_name}
 Return ONLY the JSON object, no other text."""),
     ])
     
-    # Initialize LLM
-    llm = ChatOpenAI(model=LLM_MODEL, temperature=LLM_TEMPERATURE)
+    # Initialize LLM; JSON mode guarantees the response is a single valid JSON object
+    llm = ChatOpenAI(
+        model=LLM_MODEL,
+        temperature=LLM_TEMPERATURE,
+        model_kwargs={"response_format": {"type": "json_object"}},
+        http_client=get_http_client(),
+    )
     
     # Get analysis
     response = llm.invoke(prompt.format_messages(
@@ -76,17 +134,9 @@ Return ONLY the JSON object, no other text."""),
         project_name=example_path.name
     ))
     
-    # Parse JSON response
-    if not response.content.strip():
-        raise ValueError(f"LLM returned empty response for {example_path}")
-    
-    try:
-        analysis = json.loads(response.content)
-    except json.JSONDecodeError as e:
-        LOG.error(f"Failed to parse LLM response for {example_path}: {response.content}")
-        raise ValueError(f"LLM returned invalid JSON for {example_path}: {e}")
+    analysis = orjson.loads(response.content)
     
-    return {
+    result = {
         "description": analysis.get("description", ""),
         "framework": analysis.get("framework", "unknown"),
         "build_tool": analysis.get("build_tool", "unknown"),
@@ -94,19 +144,60 @@ Return ONLY the JSON object, no other text."""),
         "example_type": analysis.get("example_type", ""),
         "key_features": analysis.get("key_features", [])
     }
+    
+    if not dry_run:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        cache_path.write_bytes(orjson.dumps(result))
+    return result
 
 
-def process_example_project(example_path: Path, project_root: Path) -> List[Document]:
-    """Process an example project with enhanced metadata"""
+def process_example_project(example_path: Path, project_root: Path,
+                            manifest: Optional[Manifest] = None, db_dir: Optional[str] = None,
+                            dry_run: bool = False) -> List[Document]:
+    """Process an example project with enhanced metadata
+    
+    When a manifest is given, only files changed since the last ingest are processed, unless
+    README.md or package.json changed: every chunk carries the LLM analysis of those two, so
+    then the whole example is re-indexed. `db_dir` and `dry_run` control the LLM analysis cache (see analyze_example_with_llm).
+    """
     docs: List[Document] = []
     
     if not example_path.exists():
         LOG.warning(f"Example path does not exist: {example_path}")
         return docs
     
+    # Collect key files at the project root plus sources under src/ in a single walk
+    file_paths: List[Path] = []
+    for root, dirs, files in os.walk(example_path):
+        in_src = root != str(example_path)
+        if in_src:
+            dirs[:] = sorted(d for d in dirs if d not in DEFAULT_EXCLUDE_DIRS and not d.startswith('.'))
+        else:
+            dirs[:] = [d for d in dirs if d == "src"]
+        for name in sorted(files):
+            if name.startswith('.'):
+                continue
+            if os.path.splitext(name)[1] in EXAMPLE_SOURCE_EXTS:
+                file_paths.append(Path(root) / name)
+            elif not in_src and (name in EXAMPLE_ROOT_FILES or ".config." in name):
+                file_paths.append(Path(root) / name)
+    
+    if manifest is not None:
+        # Check every file, so the manifest records fingerprints for all of them
+        dirty = [p for p in file_paths if manifest.is_dirty(p)]
+        if not dirty:
+            LOG.info(f"Example {example_path.name} unchanged since last ingest, skipping")
+            return docs
+        if any(p.parent == example_path and p.name in EXAMPLE_ROOT_FILES for p in dirty):
+            LOG.info(f"Example {example_path.name} README.md or package.json changed, re-indexing all files")
+            for p in file_paths:
+                manifest.mark_dirty(p)
+        else:
+            file_paths = dirty
+    
     # Extract metadata using LLM analysis
     LOG.info(f"Analyzing example {example_path.name} with LLM...")
-    analysis = analyze_example_with_llm(example_path)
+    analysis = analyze_example_with_llm(example_path, db_dir=db_dir, dry_run=dry_run)
     
     # Enhanced metadata
     base_metadata = {
@@ -122,70 +213,38 @@ def process_example_project(example_path: Path, project_root: Path) -> List[Docu
         "component": "none",
     }
     
-    # Store analysis for use in file processing
+    # Per-file-kind (file_type, description), keyed by file name first and then suffix
     example_type = analysis.get("example_type", "")
+    file_kinds = {
+        key: (file_type, template.format(example_type))
+        for key, (file_type, template) in EXAMPLE_FILE_KINDS.items()
+    }
     
-    # Process key files using include extensions
-    files_to_process = [
-        "package.json",
-        "README.md",
-        "*.config.*",
-    ]
-    
-    # Add patterns for all included extensions
-    for ext in DEFAULT_INCLUDE_EXTS:
-        if ext == ".json":
-            continue  # Already handled by package.json above
-        files_to_process.extend([
-            f"src/**/*{ext}",
-            f"*{ext}",
-        ])
-    
-    for pattern in files_to_process:
-        for file_path in example_path.glob(pattern):
-            if file_path.is_file() and not file_path.name.startswith('.'):
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                    
-                    if content.strip():  # Only process non-empty files
-                        # Create metadata for this file
-                        file_metadata = base_metadata.copy()
-                        file_metadata.update({
-                            "relpath": str(file_path.relative_to(project_root)),
-                            "ext": file_path.suffix,
-                            "filename": file_path.name,
-                            "file_type": get_file_type(file_path),
-                        })
-                        
-                        # Add file-specific metadata
-                        if file_path.name == "package.json":
-                            file_metadata["file_type"] = "dependencies"
-                            file_metadata["description"] = f"Dependencies and scripts for {example_type} example"
-                        elif file_path.suffix in ['.tsx', '.ts', '.jsx', '.js']:
-                            file_metadata["file_type"] = "implementation"
-                            file_metadata["description"] = f"Implementation code for {example_type} example"
-                        elif file_path.suffix in ['.css', '.scss', '.sass']:
-                            file_metadata["file_type"] = "stylesheet"
-                            file_metadata["description"] = f"Styling and CSS for {example_type} example"
-                        elif file_path.suffix in ['.md', '.mdx']:
-                            file_metadata["file_type"] = "documentation"
-                            file_metadata["description"] = f"Documentation for {example_type} example"
-                        elif file_path.suffix == '.html':
-                            file_metadata["file_type"] = "html"
-                            file_metadata["description"] = f"HTML template for {example_type} example"
-                        elif file_path.name.endswith('.config.') or file_path.suffix == '.json':
-                            file_metadata["file_type"] = "configuration"
-                            file_metadata["description"] = f"Build configuration for {example_type} example"
-                        
-                        doc = Document(
-                            page_content=content,
-                            metadata=file_metadata
-                        )
-                        docs.append(doc)
-                        
-                except Exception as e:
-                    LOG.warning(f"Failed to process {file_path}: {e}")
+    for file_path in file_paths:
+        try:
+            content = read_text_file(file_path)
+            
+            if content and content.strip():  # Only process non-empty text files
+                kind = file_kinds.get(file_path.name) or file_kinds.get(file_path.suffix)
+                file_type, description = kind or (get_file_type(file_path), base_metadata["description"])
+                file_metadata = {
+                    **base_metadata,
+                    "path": path_key(file_path),
+                    "relpath": str(file_path.relative_to(project_root)),
+                    "ext": file_path.suffix,
+                    "filename": file_path.name,
+                    "file_type": file_type,
+                    "description": description,
+                }
+                
+                doc = Document(
+                    page_content=content,
+                    metadata=file_metadata
+                )
+                docs.append(doc)
+                
+        except Exception as e:
+            LOG.warning(f"Failed to process {file_path}: {e}")
     
     LOG.info(f"Processed example {example_path.name}: {len(docs)} documents")
     return docs
@@ -194,38 +253,36 @@ def process_example_project(example_path: Path, project_root: Path) -> List[Docu
 def get_file_type(file_path: Path) -> str:
     """Determine the type of file for better categorization"""
     name = file_path.name.lower()
-    suffix = file_path.suffix.lower()
-    
     if name == "package.json":
         return "dependencies"
-    elif name.endswith('.config.'):
+    if ".config." in name:
         return "configuration"
-    elif suffix in ['.tsx', '.jsx']:
-        return "react_component"
-    elif suffix in ['.ts', '.js']:
-        return "typescript"
-    elif suffix in ['.css', '.scss', '.sass']:
-        return "stylesheet"
-    elif suffix == '.md' or suffix == '.mdx':
-        return "documentation"
-    elif suffix == '.html':
-        return "html"
-    elif suffix == '.json':
-        return "configuration"
-    else:
-        return "other"
+    return SUFFIX_TO_TYPE.get(file_path.suffix.lower(), "other")
 
 
-def build_example_documents(example_paths: List[Path], project_root: Path) -> List[Document]:
-    """Build documents from multiple example projects"""
+def build_example_documents(example_paths: List[Path], project_root: Path,
+                            manifest: Optional[Manifest] = None, db_dir: Optional[str] = None,
+                            dry_run: bool = False) -> List[Document]:
+    """Build documents from multiple example projects, processing them concurrently"""
     all_docs: List[Document] = []
     
+    valid_paths = []
     for example_path in example_paths:
         if example_path.exists() and example_path.is_dir():
-            docs = process_example_project(example_path, project_root)
-            all_docs.extend(docs)
+            valid_paths.append(example_path)
         else:
             LOG.warning(f"Example path not found or not a directory: {example_path}")
     
+    if valid_paths:
+        # I/O bound (disk + LLM requests); map() keeps results in input order
+        with ThreadPoolExecutor(max_workers=min(EXAMPLE_MAX_WORKERS, len(valid_paths))) as executor:
+            results = executor.map(
+                lambda p: process_example_project(p, project_root, manifest=manifest,
+                                                  db_dir=db_dir, dry_run=dry_run),
+                valid_paths,
+            )
+            for docs in results:
+                all_docs.extend(docs)
+    
     LOG.info(f"Total example documents: {len(all_docs)}")
     return all_docs
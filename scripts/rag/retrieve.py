@@ -1,161 +1,257 @@
 """
 Retrieval functionality for RAG system
 
-This module contains the SelfQueryRetriever setup, chain creation, and query functionality.
+This module contains the hybrid and structured-query retrievers, chain creation, and query functionality.
 """
 
+import functools
+import io
 import os
-from typing import Dict, Any
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Literal, Optional
 
+from pydantic import BaseModel, Field
 from langchain_openai import ChatOpenAI
-from langchain.retrievers.self_query.base import SelfQueryRetriever
-from langchain.chains.query_constructor.schema import AttributeInfo
+from langchain.schema import Document
 from langchain.prompts import ChatPromptTemplate
 from langchain.schema.runnable import RunnableMap
 
-from utils import LOG
+from utils import LOG, get_http_client, render_tag
 from config import (
-    LLM_MODEL, LLM_TEMPERATURE, RETRIEVER_K,
+    LLM_MODEL, LLM_TEMPERATURE, RETRIEVER_K, RRF_K,
     SYSTEM_PROMPT, HUMAN_PROMPT, SELF_QUERY_VERBOSE
 )
-from db import create_database
+from db import create_database, content_hash
 
 
 
 # ----------------------------
 # Document Formatting
 # ----------------------------
+DOC_SEPARATOR = "\n" + "-" * 80
+
 def format_docs(docs):
-    """Format documents for the prompt with citations and content"""
-    lines = []
+    """Format documents for the prompt with citations and content
+    
+    Chunks carry their citation header from ingest; older chunks have it rendered here.
+    """
+    buf = io.StringIO()
+    write = buf.write
     for i, d in enumerate(docs, 1):
-        rel = d.metadata.get("relpath", "unknown")
-        start = d.metadata.get("start_line", "?")
-        end = d.metadata.get("end_line", "?")
-        kind = d.metadata.get("kind", "unknown")
-        ext = d.metadata.get("ext", "")
-        component = d.metadata.get("component", "")
-        
-        # Build tag with metadata
-        tag_parts = [kind]
-        if ext:
-            tag_parts.append(ext)
-        if component:
-            tag_parts.append(f"component={component}")
-        
-        # Add example-specific metadata
-        if kind == "example":
-            example_type = d.metadata.get("example_type", "")
-            build_tool = d.metadata.get("build_tool", "")
-            framework = d.metadata.get("framework", "")
-            complexity = d.metadata.get("complexity", "")
-            file_type = d.metadata.get("file_type", "")
-            key_features = d.metadata.get("key_features", [])
+        if i > 1:
+            write("\n")
+        write(d.metadata.get("_preformatted") or render_tag(d.metadata))
+        write(d.page_content)
+        write(DOC_SEPARATOR)
+    return buf.getvalue()
+
+# ----------------------------
+# Structured query construction
+# ----------------------------
+class QuerySchema(BaseModel):
+    """Search request derived from the user's question: query text plus optional metadata filters"""
+    query: str = Field(description="Search text for the vector store, with filter terms removed. Use the question itself if nothing needs rewriting.")
+    kind: Optional[Literal["code", "docs", "example"]] = Field(None, description="Source type: 'code' (implementation files), 'docs' (documentation files), or 'example' (working example projects). Code files contain the actual component implementations, interfaces, and styling. Docs files contain usage examples and explanations. Example files contain complete working implementations with different build tools and complexity levels.")
+    ext: Optional[str] = Field(None, description="File extension including the dot: .tsx/.ts (TypeScript components), .css/.scss (styling), .md/.mdx (documentation), .jsx/.js (JavaScript), .html (HTML templates).")
+    component: Optional[str] = Field(None, description="The primary component name associated with a chunk, e.g. 'Button'. Only set when the question is about one specific component.")
+    example_type: Optional[str] = Field(None, description="For examples: 'console', 'components', 'tailwind', 'vite', 'themes', etc.")
+    build_tool: Optional[str] = Field(None, description="Build tool used by an example: 'next', 'vite', 'webpack', 'rollup', etc.")
+    framework: Optional[str] = Field(None, description="Framework used by an example: 'react', 'next', 'vue', 'svelte', etc.")
+    complexity: Optional[int] = Field(None, description="Example complexity level: 1 (simple) to 5 (advanced).")
+    file_type: Optional[str] = Field(None, description="Type of file within examples: 'dependencies', 'implementation', 'stylesheet', 'configuration', 'documentation', 'html'.")
+
+# Document content description for query construction
+DOCUMENT_CONTENT_DESCRIPTION = (
+    "A comprehensive collection of project files including React component implementations, TypeScript interfaces, CSS styling files, documentation, and working example projects. "
+    "When searching for component information, return ALL relevant files: component implementation files (.tsx/.ts), CSS files with styling and design tokens, "
+    "and documentation files (.md/.mdx) with usage examples. CSS files contain the authoritative styling information including custom properties and design tokens. "
+    "TypeScript files contain component definitions, prop interfaces, and variant definitions. Documentation files contain usage examples and explanations. "
+    "Example projects contain complete working implementations with different build tools (Next.js, Vite, etc.) and complexity levels (1-5). "
+    "For code generation questions, prefer examples that match the user's build tool and complexity requirements. "
+    "For complete information about a component, you need both the implementation (code) and the styling (CSS) files."
+)
+
+QUERY_CONSTRUCTOR_PROMPT = (
+    "Turn the user's question into a search request over this collection:\n"
+    f"{DOCUMENT_CONTENT_DESCRIPTION}\n\n"
+    "Only set a filter when the question clearly restricts results to it; "
+    "filters exclude every chunk that does not match exactly."
+)
+
+class StructuredQueryRetriever:
+    """Retriever that builds its search with one structured-output LLM call
+    
+    An unfiltered vector search for the raw question runs while the LLM is constructing
+    the query, and is used directly when the LLM adds no filters and keeps the query text.
+    Pass the question's embedding when the caller already has it, so it is not embedded again.
+    """
+    
+    def __init__(self, database, llm: ChatOpenAI, k: int = RETRIEVER_K):
+        self.database = database
+        self.k = k
+        self.query_llm = llm.with_structured_output(QuerySchema)
+    
+    @staticmethod
+    def build_filter(structured: QuerySchema) -> Optional[Dict[str, Any]]:
+        conditions = [
+            {name: value}
+            for name, value in structured.model_dump(exclude={"query"}).items()
+            if value not in (None, "")
+        ]
+        if not conditions:
+            return None
+        return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+    
+    def invoke(self, question: str, question_vector: Optional[List[float]] = None) -> List[Document]:
+        if question_vector is None:
+            question_vector = self.database.embeddings.embed_query(question)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            prefetch = executor.submit(self.database.search_by_vector, question_vector, self.k)
+            structured = self.query_llm.invoke([
+                ("system", QUERY_CONSTRUCTOR_PROMPT),
+                ("human", question),
+            ])
+            where = self.build_filter(structured)
+            if SELF_QUERY_VERBOSE:
+                LOG.info(f"Structured query: {structured.query!r}, filter: {where}")
             
-            if example_type:
-                tag_parts.append(f"example={example_type}")
-            if build_tool:
-                tag_parts.append(f"build={build_tool}")
-            if framework:
-                tag_parts.append(f"framework={framework}")
-            if complexity:
-                tag_parts.append(f"complexity={complexity}")
-            if file_type:
-                tag_parts.append(f"file_type={file_type}")
-            if key_features:
-                # key_features is now a string, so just show first part
-                features_str = key_features.split(", ")[:3]  # Show first 3 features
-                tag_parts.append(f"features={','.join(features_str)}")
-        
-        tag = f"[{', '.join(tag_parts)}]"
-        
-        # Include the actual document content
-        lines.append(f"- {rel}{tag}]")
-        lines.append(f"Content:\n{d.page_content}")
-        lines.append("-" * 80)
-    return "\n".join(lines)
+            same_query = structured.query.strip() == question.strip()
+            if where is None and same_query:
+                return prefetch.result()
+            # Only a rewritten query text needs a fresh embedding
+            query_vector = question_vector if same_query else self.database.embeddings.embed_query(structured.query)
+            docs = self.database.search_by_vector(query_vector, self.k, filter=where)
+            if not docs:
+                LOG.info("Filtered search returned nothing, using unfiltered results")
+                return prefetch.result()
+            return docs
 
 # ----------------------------
-# Chain Creation
+# Hybrid lexical + vector retrieval
 # ----------------------------
-def make_chain(db_dir: str = ".chroma"):
-    """Create a RAG chain with SelfQueryRetriever"""
+# Questions that name metadata fields want structured filters, e.g. "kind: example"
+FILTER_SIGNAL_RE = re.compile(r"\b(kind|ext|component|complexity|framework|build_tool)\s*[:=]", re.IGNORECASE)
+
+def _doc_key(d: Document) -> bytes:
+    # Identical chunks from different files are one result
+    return content_hash(d.page_content)
+
+def reciprocal_rank_fusion(rankings: List[List[Document]], k: int) -> List[Document]:
+    """Merge ranked lists by Reciprocal Rank Fusion and return the top k"""
+    scores: Dict[bytes, float] = {}
+    docs: Dict[bytes, Document] = {}
+    for ranking in rankings:
+        for rank, d in enumerate(ranking, 1):
+            key = _doc_key(d)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (RRF_K + rank)
+            docs.setdefault(key, d)
+    best = sorted(scores, key=scores.get, reverse=True)[:k]
+    return [docs[key] for key in best]
+
+class HybridRetriever:
+    """BM25 and vector search run concurrently and merged with Reciprocal Rank Fusion
     
-    # Initialize database
-    database = create_database(db_dir=db_dir)
-    
-    # Metadata field information for SelfQueryRetriever
-    metadata_field_info = [
-        AttributeInfo(name="kind", description="Source type: 'code' (implementation files), 'docs' (documentation files), or 'example' (working example projects). Code files contain the actual component implementations, interfaces, and styling. Docs files contain usage examples and explanations. Example files contain complete working implementations with different build tools and complexity levels.", type="string"),
-        AttributeInfo(name="ext", description="File extension: .tsx/.ts (TypeScript components), .css/.scss (styling), .md/.mdx (documentation), .jsx/.js (JavaScript), .html (HTML templates). CSS files contain design tokens and component styles. TypeScript files contain component definitions and interfaces.", type="string"),
-        AttributeInfo(name="relpath", description="File path relative to the project root. Use this to identify specific files and their location in the project structure.", type="string"),
-        AttributeInfo(name="component", description="The primary component name associated with this chunk. Use this to find all files related to a specific component (e.g., 'Button' will find Button component files, CSS, and docs).", type="string"),
-        AttributeInfo(name="title", description="Document title or section heading for documentation files. Helps identify specific sections of documentation.", type="string"),
-        AttributeInfo(name="start_line", description="Starting line number of this chunk in the source file (1-based).", type="integer"),
-        AttributeInfo(name="end_line", description="Ending line number of this chunk in the source file (1-based).", type="integer"),
-        AttributeInfo(name="example_type", description="For examples: 'console', 'components', 'tailwind', 'vite', 'themes', etc. Use this to find examples of specific implementation patterns.", type="string"),
-        AttributeInfo(name="build_tool", description="Build tool used: 'next', 'vite', 'webpack', 'rollup', etc. Use this to find examples using specific build tools.", type="string"),
-        AttributeInfo(name="framework", description="Framework used: 'react', 'next', 'vue', 'svelte', etc. Use this to find examples using specific frameworks.", type="string"),
-        AttributeInfo(name="complexity", description="Complexity level: 1 (simple) to 5 (advanced). Use this to find examples matching the desired complexity level.", type="integer"),
-        AttributeInfo(name="file_type", description="Type of file: 'dependencies', 'implementation', 'stylesheet', 'configuration', 'documentation', 'html'. Use this to find specific types of files within examples.", type="string"),
-        AttributeInfo(name="key_features", description="Comma-separated list of key features this example demonstrates. Use this to find examples with specific functionality.", type="string"),
-    ]
-    
-    # Document content description for SelfQueryRetriever
-    document_content_description = (
-        "A comprehensive collection of project files including React component implementations, TypeScript interfaces, CSS styling files, documentation, and working example projects. "
-        "When searching for component information, return ALL relevant files: component implementation files (.tsx/.ts), CSS files with styling and design tokens, "
-        "and documentation files (.md/.mdx) with usage examples. CSS files contain the authoritative styling information including custom properties and design tokens. "
-        "TypeScript files contain component definitions, prop interfaces, and variant definitions. Documentation files contain usage examples and explanations. "
-        "Example projects contain complete working implementations with different build tools (Next.js, Vite, etc.) and complexity levels (1-5). "
-        "For code generation questions, prefer examples that match the user's build tool and complexity requirements. "
-        "For complete information about a component, you need both the implementation (code) and the styling (CSS) files."
-    )
+    Needs no LLM call. Falls back to vector search alone if no BM25 index has been built.
+    Pass the question's embedding when the caller already has it, so it is not embedded again.
+    """
+    
+    def __init__(self, database, k: int = RETRIEVER_K):
+        self.database = database
+        self.k = k
     
-    # Create SelfQueryRetriever with optimized settings
-    llm = ChatOpenAI(
+    def invoke(self, question: str, question_vector: Optional[List[float]] = None) -> List[Document]:
+        if question_vector is None:
+            question_vector = self.database.embeddings.embed_query(question)
+        lexical = self.database.lexical_retriever
+        if lexical is None:
+            return self.database.search_by_vector(question_vector, self.k)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            vector_future = executor.submit(self.database.search_by_vector, question_vector, self.k)
+            lexical_docs = lexical.invoke(question)
+            return reciprocal_rank_fusion([vector_future.result(), lexical_docs], self.k)
+
+# ----------------------------
+# Chain Creation
+# ----------------------------
+@functools.lru_cache(maxsize=None)
+def get_llm() -> ChatOpenAI:
+    """Chat model shared by query construction and answering, reusing one connection pool"""
+    return ChatOpenAI(
         model=LLM_MODEL, 
         temperature=LLM_TEMPERATURE,
-        request_timeout=10,  # 10 second timeout
-        max_retries=1  # Reduce retries
-    )
-    retriever = SelfQueryRetriever.from_llm(
-        llm,
-        database.vectorstore,
-        document_contents=document_content_description,
-        metadata_field_info=metadata_field_info,
-        verbose=SELF_QUERY_VERBOSE,
-        search_kwargs={"k": RETRIEVER_K},
-        enable_limit=True,  # Enable query limits
-        max_llm_queries_per_chain=1,  # Limit LLM calls
+        request_timeout=15,  # 15 second timeout
+        max_retries=1,  # Reduce retries
+        http_client=get_http_client(),
     )
-    
-    LOG.info("SelfQueryRetriever initialized successfully")
-    
-    # Create prompt template
+
+@functools.lru_cache(maxsize=None)
+def get_answer_chain():
+    """Prompt | LLM runnable that answers from pre-formatted sources"""
     prompt = ChatPromptTemplate.from_messages([
         ("system", SYSTEM_PROMPT),
         ("human", HUMAN_PROMPT),
     ])
+    return prompt | get_llm()
+
+@functools.lru_cache(maxsize=4)
+def make_chain(db_dir: str = ".chroma", ann_profile: str = None):
+    """Create a RAG chain, memoized per database directory and ANN profile
+    
+    Questions are retrieved with the hybrid BM25 + vector retriever, unless they name
+    metadata filters, which go to the structured-query retriever. The chain input may carry
+    a precomputed "question_vector" to skip re-embedding the question.
+    """
+    
+    # Initialize database
+    database = create_database(db_dir=db_dir, ann_profile=ann_profile)
+    
+    hybrid_retriever = HybridRetriever(database, k=RETRIEVER_K)
+    structured_retriever = StructuredQueryRetriever(database, get_llm(), k=RETRIEVER_K)
+    
+    def retrieve(question: str, question_vector: Optional[List[float]] = None) -> List[Document]:
+        if FILTER_SIGNAL_RE.search(question):
+            return structured_retriever.invoke(question, question_vector)
+        return hybrid_retriever.invoke(question, question_vector)
+    
+    LOG.info("Retrievers initialized successfully")
     
     # Create the chain
     chain = RunnableMap({
-        "sources": lambda x: format_docs(retriever.invoke(x["question"])),
+        "sources": lambda x: format_docs(retrieve(x["question"], x.get("question_vector"))),
         "question": lambda x: x["question"],
-    }) | prompt | llm
+    }) | get_answer_chain()
     
     return chain
 
 # ----------------------------
 # Query Function
 # ----------------------------
-def query(question: str, db_dir: str = ".chroma", debug_retrieval: bool = False, use_fast_search: bool = False) -> Dict[str, Any]:
-    """Query the RAG system with a question"""
+def query(question: str, db_dir: str = ".chroma", debug_retrieval: bool = False, use_fast_search: bool = False,
+          ann_profile: str = None) -> Dict[str, Any]:
+    """Query the RAG system with a question
+    
+    Answers are cached by question embedding; a near-identical question asked with the
+    same method and ANN profile returns the cached answer without retrieval or LLM calls.
+    """
+    method = "fast_similarity_search" if use_fast_search else "hybrid_retriever"
+    database = create_database(db_dir=db_dir, ann_profile=ann_profile)
+    question_vector = database.embeddings.embed_query(question)
+    
+    # Debug runs always retrieve so the documents can be shown
+    if not debug_retrieval:
+        cached = database.answer_cache.lookup(question, question_vector, method,
+                                              ann_profile=ann_profile, fast=use_fast_search)
+        if cached is not None:
+            return {
+                "question": question,
+                "answer": cached,
+                "method": f"{method} (cached)"
+            }
     
     if use_fast_search:
         # Use simple similarity search for faster results
-        database = create_database(db_dir=db_dir)
-        docs = database.similarity_search(question, k=RETRIEVER_K)
+        docs = database.search_by_vector(question_vector, k=RETRIEVER_K)
         
         if debug_retrieval:
             print("\n=== RETRIEVED DOCUMENTS (Fast Search) ===")
@@ -172,36 +268,20 @@ def query(question: str, db_dir: str = ".chroma", debug_retrieval: bool = False,
                 print("-" * 50)
             print("\n" + "="*80 + "\n")
         
-        sources = format_docs(docs)
-        
-        # Create simple chain without SelfQueryRetriever
-        llm = ChatOpenAI(
-            model=LLM_MODEL, 
-            temperature=LLM_TEMPERATURE,
-            request_timeout=15
-        )
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", SYSTEM_PROMPT),
-            ("human", HUMAN_PROMPT),
-        ])
-        
-        response = prompt.invoke({
-            "question": question,
-            "sources": sources
-        }) | llm
-        
-        return {
+        # Answer directly from the retrieved documents, without query construction
+        response = get_answer_chain().invoke({
             "question": question,
-            "answer": response.content,
-            "method": "fast_similarity_search"
-        }
+            "sources": format_docs(docs)
+        })
     else:
-        # Use SelfQueryRetriever for more accurate results
-        chain = make_chain(db_dir)
-        response = chain.invoke({"question": question})
-        
-        return {
-            "question": question,
-            "answer": response.content,
-            "method": "self_query_retriever"
-        }
+        # Use hybrid or structured-query retrieval for more accurate results
+        chain = make_chain(db_dir, ann_profile)
+        response = chain.invoke({"question": question, "question_vector": question_vector})
+    
+    database.answer_cache.put(question, question_vector, method, response.content,
+                              ann_profile=ann_profile, fast=use_fast_search)
+    return {
+        "question": question,
+        "answer": response.content,
+        "method": method
+    }
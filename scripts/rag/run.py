@@ -5,43 +5,81 @@
 #   "langchain",
 #   "langchain-openai",
 #   "langchain-chroma",
+#   "langchain-community",
+#   "rank-bm25",
+#   "httpx[http2]",
 #   "pathspec",
 #   "python-frontmatter",
 #   "tree-sitter",
 #   "tree-sitter-typescript",
 #   "tree-sitter-javascript",
 #   "tiktoken",
-#   "lark"
+#   "orjson",
+#   "numpy"
 # ]
 # ///
 
+import queue
+import re
+import threading
 import time
 import argparse
+from bisect import bisect_right
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+from itertools import accumulate
 from pathlib import Path
-from typing import List, Dict, Set
+from typing import DefaultDict, Iterable, Iterator, List, Dict, Optional, Set, Tuple
 
 from langchain.schema import Document
 from langchain.text_splitter import TextSplitter
-from langchain_openai import OpenAIEmbeddings
 
-from utils import LOG, load_gitignore, iter_files
+from utils import LOG, Manifest, load_gitignore, iter_files, batched, render_tag
 from config import (
     DEFAULT_INCLUDE_EXTS, DEFAULT_EXCLUDE_DIRS, DEFAULT_EXCLUDE_EXTS,
     SRC_EXCLUDE_DIRS, DEFAULT_DB_DIR, DEFAULT_CHUNK_CHARS, DEFAULT_CHUNK_OVERLAP,
     TS_CHUNK_CHARS, TS_CHUNK_OVERLAP, DOCS_CHUNK_CHARS, DOCS_CHUNK_OVERLAP,
     EXAMPLE_CHUNK_CHARS, EXAMPLE_CHUNK_OVERLAP,
     EMBEDDING_MODEL, TOP_COMPONENT_COUNT, CONTENT_PREVIEW_LENGTH,
-    PROPS_FILE_PATTERNS, INTERFACE_CONTENT_PATTERNS
+    PROPS_FILE_PATTERNS, INTERFACE_CONTENT_PATTERNS, MANIFEST_FILE, COMPONENT_CACHE_FILE, INGEST_BATCH_SIZE,
+    BUILD_MAX_WORKERS, BUILD_CHUNKSIZE, PARALLEL_MIN_FILES, SPLIT_BATCH_SIZE, INGEST_QUEUE_BATCHES,
+    ANN_PROFILES, DEFAULT_ANN_PROFILE
 )
 from docs import process_documentation_file
-from source import process_source_file
-from examples import process_example_project
+from source import process_source_file, close_component_caches
+from examples import process_example_project, build_example_documents
 from db import create_database
 
 
 # ----------------------------
 # Line-aware splitter (for citations)
 # ----------------------------
+def _chunk_boundaries(line_lens: List[int], chunk_size: int, chunk_overlap: int) -> List[Tuple[int, int]]:
+    """Half-open [start, end) line ranges for chunks of at most chunk_size chars (line + newline)
+    
+    Works on prefix sums of line lengths, so each boundary is a binary search rather than a
+    per-line loop. A chunk always holds at least one line; consecutive chunks share trailing
+    lines worth at least chunk_overlap chars, unless that would leave no room for a new line.
+    """
+    n = len(line_lens)
+    cum = [0, *accumulate(line_lens)]
+    bounds: List[Tuple[int, int]] = []
+    start = 0
+    while start < n:
+        end = max(bisect_right(cum, cum[start] + chunk_size) - 1, start + 1)
+        bounds.append((start, end))
+        if end >= n:
+            break
+        # Overlap: trailing lines, counted back until they reach chunk_overlap chars
+        next_start = end
+        if chunk_overlap > 0:
+            next_start = max(start + 1, bisect_right(cum, cum[end] - chunk_overlap) - 1)
+            if cum[end + 1] - cum[next_start] > chunk_size:
+                next_start = end  # Overlap plus the next line doesn't fit; keep making progress
+        start = next_start
+    return bounds
+
 class LineAwareSplitter(TextSplitter):
     def __init__(self, chunk_size=DEFAULT_CHUNK_CHARS, chunk_overlap=DEFAULT_CHUNK_OVERLAP):
         super().__init__(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
@@ -52,47 +90,108 @@ class LineAwareSplitter(TextSplitter):
     def split_documents(self, docs: List[Document]) -> List[Document]:
         out: List[Document] = []
         for d in docs:
-            content: str = d.page_content
-            lines = content.splitlines()
-            current: List[str] = []
-            current_len = 0
-            start_line_idx = 0
-            i = 0
-            while i < len(lines):
-                line = lines[i]
-                extra = len(line) + 1
-                if current_len + extra > self._chunk_size and current:
-                    chunk_text = "\n".join(current).rstrip()
-                    end_line_idx = start_line_idx + len(current) - 1
-                    meta = dict(d.metadata)
-                    meta["start_line"] = meta.get("start_line", start_line_idx + 1)
-                    meta["end_line"] = meta.get("end_line", end_line_idx + 1)
-                    out.append(Document(page_content=chunk_text, metadata=meta))
-                    # overlap by line-length approximation
-                    overlap_lines = []
-                    remaining = self._chunk_overlap
-                    j = len(current) - 1
-                    while j >= 0 and remaining > 0:
-                        l = current[j]
-                        remaining -= (len(l) + 1)
-                        overlap_lines.insert(0, l)
-                        j -= 1
-                    current = overlap_lines.copy()
-                    current_len = sum(len(l) + 1 for l in current)
-                    start_line_idx = i - len(current)
-                else:
-                    current.append(line)
-                    current_len += extra
-                    i += 1
-            if current:
-                chunk_text = "\n".join(current).rstrip()
-                end_line_idx = start_line_idx + len(current) - 1
+            lines = d.page_content.splitlines()
+            # Documents may begin mid-file (e.g. markdown sections); line numbers are offset
+            first_line = d.metadata.get("start_line", 1)
+            # Most files fit in one chunk; skip boundary search for them
+            if sum(map(len, lines)) + len(lines) <= self._chunk_size:
+                bounds = [(0, len(lines))] if lines else []
+            else:
+                line_lens = [len(line) + 1 for line in lines]
+                bounds = _chunk_boundaries(line_lens, self._chunk_size, self._chunk_overlap)
+            for start, end in bounds:
                 meta = dict(d.metadata)
-                meta["start_line"] = meta.get("start_line", start_line_idx + 1)
-                meta["end_line"] = meta.get("end_line", end_line_idx + 1)
-                out.append(Document(page_content=chunk_text, metadata=meta))
+                meta["start_line"] = first_line + start
+                meta["end_line"] = first_line + end - 1
+                out.append(Document(page_content="\n".join(lines[start:end]).rstrip(), metadata=meta))
         return out
 
+@lru_cache(maxsize=None)
+def get_splitter(chunk_size: int, chunk_overlap: int) -> LineAwareSplitter:
+    """Shared splitter instance for a chunk size/overlap pair"""
+    return LineAwareSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+# ----------------------------
+# Chunking strategy per document
+# ----------------------------
+# Interface definition files are never split; one alternation scans relpath once
+PROPS_FILE_RE = re.compile("|".join(re.escape(p) for p in PROPS_FILE_PATTERNS))
+
+# (chunk_size, chunk_overlap) by kind, then by extension; anything else uses the CLI default
+KIND_CHUNKING = {
+    # Larger chunks for examples to keep complete implementations together
+    "example": (EXAMPLE_CHUNK_CHARS, EXAMPLE_CHUNK_OVERLAP),
+    # Larger chunks for documentation to keep complete examples
+    "docs": (DOCS_CHUNK_CHARS, DOCS_CHUNK_OVERLAP),
+}
+EXT_CHUNKING = {
+    ".md": (DOCS_CHUNK_CHARS, DOCS_CHUNK_OVERLAP),
+    ".mdx": (DOCS_CHUNK_CHARS, DOCS_CHUNK_OVERLAP),
+    # Larger chunks for TypeScript files to keep interfaces together
+    ".ts": (TS_CHUNK_CHARS, TS_CHUNK_OVERLAP),
+    ".tsx": (TS_CHUNK_CHARS, TS_CHUNK_OVERLAP),
+}
+
+def iter_chunks(docs: List[Document], chunk_chars: int, chunk_overlap: int) -> Iterator[Document]:
+    """Yield chunks lazily, applying different chunking strategies based on file type"""
+    default_splitter = get_splitter(chunk_chars, chunk_overlap)
+    kind_splitters = {kind: get_splitter(*params) for kind, params in KIND_CHUNKING.items()}
+    ext_splitters = {ext: get_splitter(*params) for ext, params in EXT_CHUNKING.items()}
+    # Bucket documents per splitter, then split each bucket a batch at a time
+    buckets: Dict[LineAwareSplitter, List[Document]] = defaultdict(list)
+    for doc in docs:
+        # Citation header is fixed by file-level metadata, so render it once for all chunks
+        doc.metadata["_preformatted"] = render_tag(doc.metadata)
+        # Special handling for interface definition files - keep them as single chunks
+        # to preserve complete definitions
+        if PROPS_FILE_RE.search(doc.metadata.get("relpath", "")):
+            yield doc
+            continue
+        splitter = (
+            kind_splitters.get(doc.metadata.get("kind", ""))
+            or ext_splitters.get(doc.metadata.get("ext", "").lower())
+            or default_splitter
+        )
+        buckets[splitter].append(doc)
+    for splitter, bucket in buckets.items():
+        for batch in batched(bucket, SPLIT_BATCH_SIZE):
+            yield from splitter.split_documents(batch)
+
+def stream_to_database(database, chunks: Iterable[Document]) -> int:
+    """Insert chunks in batches from a writer thread while more chunks are produced
+    
+    A bounded queue between splitting and embedding keeps at most a few batches of
+    chunks in memory. Returns the number of chunks inserted.
+    """
+    pending: "queue.Queue[Optional[List[Document]]]" = queue.Queue(maxsize=INGEST_QUEUE_BATCHES)
+    errors: List[BaseException] = []
+
+    def writer():
+        while (batch := pending.get()) is not None:
+            if errors:
+                continue  # Drain so the producer never blocks after a failure
+            try:
+                database.add_documents(batch)
+            except BaseException as e:
+                errors.append(e)
+
+    thread = threading.Thread(target=writer, name="chroma-writer", daemon=True)
+    thread.start()
+    total = 0
+    try:
+        for i, batch in enumerate(batched(chunks, INGEST_BATCH_SIZE), 1):
+            if errors:
+                break
+            pending.put(batch)
+            total += len(batch)
+            LOG.info(f"Queued batch {i} ({total} chunks so far)")
+    finally:
+        pending.put(None)
+        thread.join()
+    if errors:
+        raise errors[0]
+    return total
+
 # ----------------------------
 # Plugin Registry for Document Processing
 # ----------------------------
@@ -107,35 +206,76 @@ PROCESSORS = {
 # ----------------------------
 # Build Documents (code & docs), with auto component tagging
 # ----------------------------
+def _process_path(kind: str, p: Path, project_root: Path, component_cache_path: Optional[str] = None):
+    """Process one file with fresh accumulators; runs in a worker process
+    
+    Returns the documents plus this file's component counts, component files and docs
+    stats, which the caller merges.
+    """
+    processor = PROCESSORS[kind]
+    counts: Counter = Counter()
+    files: DefaultDict[str, Set[str]] = defaultdict(set)
+    stats: Counter = Counter()
+    try:
+        if kind == "docs":
+            # Documentation processors need docs_stats
+            docs = processor(p, project_root, counts, files, stats)
+        elif kind == "code":
+            docs = processor(p, project_root, counts, files, component_cache_path)
+        else:
+            # Other processors don't need docs_stats
+            docs = processor(p, project_root, counts, files)
+    except Exception as e:
+        LOG.warning(f"Error processing {p}: {e}")
+        docs = []
+    return docs, counts, files, stats
+
 def build_documents(paths: List[Path], kind: str, project_root: Path,
-                    component_counts: Dict[str, int], component_files: Dict[str, Set[str]], 
-                    docs_stats: Dict[str, int]) -> List[Document]:
-    """Build documents using modular processing functions"""
+                    component_counts: Counter, component_files: DefaultDict[str, Set[str]], 
+                    docs_stats: Dict[str, int], component_cache_path: Optional[str] = None) -> List[Document]:
+    """Build documents using modular processing functions, in a process pool for large file sets
+    
+    Source files cache extracted components at `component_cache_path`; None disables the cache.
+    """
     docs: List[Document] = []
     
     # Get the appropriate processor for this kind
-    processor = PROCESSORS.get(kind)
-    if not processor:
+    if kind not in PROCESSORS:
         LOG.warning(f"No processor found for kind '{kind}', skipping files")
         return docs
     
-    for p in paths:
-        try:
-            if kind == "docs":
-                # Documentation processors need docs_stats
-                docs.extend(processor(p, project_root, component_counts, component_files, docs_stats))
-            else:
-                # Other processors don't need docs_stats
-                docs.extend(processor(p, project_root, component_counts, component_files))
-        except Exception as e:
-            LOG.warning(f"Error processing {p}: {e}")
-            continue
+    process = partial(_process_path, kind, project_root=project_root,
+                      component_cache_path=component_cache_path)
+    if len(paths) < PARALLEL_MIN_FILES:
+        # Pool startup costs more than parsing a handful of files
+        results = map(process, paths)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(max_workers=BUILD_MAX_WORKERS)
+        results = executor.map(process, paths, chunksize=BUILD_CHUNKSIZE)
+    try:
+        for file_docs, counts, files, stats in results:
+            docs.extend(file_docs)
+            component_counts.update(counts)
+            for c, relpaths in files.items():
+                component_files[c].update(relpaths)
+            for key, n in stats.items():
+                docs_stats[key] = docs_stats.get(key, 0) + n
+    finally:
+        if executor is not None:
+            executor.shutdown()
     
     return docs
 
 # ----------------------------
 # Document Summary (for dry runs)
 # ----------------------------
+def _component_names(comps) -> Tuple[str, ...]:
+    """Component names from chunk metadata: a tuple at ingest, a ", "-joined string once stored"""
+    if isinstance(comps, str):
+        return tuple(comps.split(", ")) if comps else ()
+    return tuple(comps or ())
+
 def print_document_summary(chunks: List[Document], component_counts: Dict[str, int], 
                           component_files: Dict[str, Set[str]], docs_stats: Dict[str, int]):
     """Print detailed document information for dry runs"""
@@ -143,27 +283,46 @@ def print_document_summary(chunks: List[Document], component_counts: Dict[str, i
     print("DRY RUN DOCUMENT SUMMARY")
     print("="*80)
     
-    # Group chunks by file
-    file_chunks: Dict[str, List[Document]] = {}
+    # Aggregate per file, per docs page and chunk sizes in a single pass
+    file_info: Dict[str, Dict] = {}
+    docs_pages: Dict[str, Dict] = {}
+    size_count = size_total = 0
+    size_min = size_max = None
     for chunk in chunks:
-        relpath = chunk.metadata.get("relpath", "unknown")
-        file_chunks.setdefault(relpath, []).append(chunk)
+        m = chunk.metadata
+        relpath = m.get("relpath", "unknown")
+        components = _component_names(m.get("components", ""))
+        
+        info = file_info.get(relpath)
+        if info is None:
+            info = file_info[relpath] = {
+                "kind": m.get("kind", ""), "ext": m.get("ext", ""), "chunks": 0, "components": set()
+            }
+        info["chunks"] += 1
+        info["components"].update(components)
+        
+        if m.get("kind") == "docs":
+            page = docs_pages.get(relpath)
+            if page is None:
+                # Get the best title for this page
+                title = m.get("title", "") or m.get("h1", "") or m.get("h2", "") or m.get("h3", "")
+                page = docs_pages[relpath] = {"title": title or "Untitled", "sections": 0, "components": set()}
+            page["sections"] += 1
+            page["components"].update(components)
+        
+        size = len(chunk.page_content)
+        size_count += 1
+        size_total += size
+        if size_min is None or size < size_min:
+            size_min = size
+        if size_max is None or size > size_max:
+            size_max = size
     
-    print(f"\n📁 FILES PROCESSED ({len(file_chunks)} files):")
+    print(f"\n📁 FILES PROCESSED ({len(file_info)} files):")
     print("-" * 40)
-    for relpath, chunk_list in sorted(file_chunks.items()):
-        kind = chunk_list[0].metadata.get("kind", "")
-        ext = chunk_list[0].metadata.get("ext", "")
-        components = set()
-        for chunk in chunk_list:
-            comps = chunk.metadata.get("components", "")
-            if isinstance(comps, str) and comps:
-                components.update(comps.split(", "))
-            elif isinstance(comps, (list, set)):
-                components.update(comps)
-        
-        comp_str = f" [{', '.join(sorted(components))}]" if components else ""
-        print(f"  {relpath} ({kind}{ext}){comp_str} - {len(chunk_list)} chunks")
+    for relpath, info in sorted(file_info.items()):
+        comp_str = f" [{', '.join(sorted(info['components']))}]" if info['components'] else ""
+        print(f"  {relpath} ({info['kind']}{info['ext']}){comp_str} - {info['chunks']} chunks")
     
     if docs_stats:
         print(f"\n📚 DOCS STATS:")
@@ -173,31 +332,6 @@ def print_document_summary(chunks: List[Document], component_counts: Dict[str, i
         print(f"  Titled pages: {docs_stats.get('titled_pages', 0)}")
         
         # Show docs pages
-        docs_pages = {}
-        for chunk in chunks:
-            if chunk.metadata.get("kind") == "docs":
-                relpath = chunk.metadata.get("relpath", "unknown")
-                title = chunk.metadata.get("title", "")
-                h1 = chunk.metadata.get("h1", "")
-                h2 = chunk.metadata.get("h2", "")
-                h3 = chunk.metadata.get("h3", "")
-                
-                # Get the best title for this page
-                page_title = title or h1 or h2 or h3 or "Untitled"
-                
-                docs_pages.setdefault(relpath, {
-                    "title": page_title,
-                    "sections": 0,
-                    "components": set()
-                })["sections"] += 1
-                
-                # Add components found in this chunk
-                comps = chunk.metadata.get("components", "")
-                if isinstance(comps, str) and comps:
-                    docs_pages[relpath]["components"].update(comps.split(", "))
-                elif isinstance(comps, (list, set)):
-                    docs_pages[relpath]["components"].update(comps)
-        
         if docs_pages:
             print(f"\n📄 DOCS PAGES ({len(docs_pages)} pages):")
             print("-" * 40)
@@ -215,16 +349,12 @@ def print_document_summary(chunks: List[Document], component_counts: Dict[str, i
     
     print(f"\n📊 CHUNK STATISTICS:")
     print("-" * 40)
-    print(f"  Total chunks: {len(chunks)}")
+    print(f"  Total chunks: {size_count}")
     
     # Chunk size distribution
-    sizes = [len(chunk.page_content) for chunk in chunks]
-    if sizes:
-        avg_size = sum(sizes) / len(sizes)
-        min_size = min(sizes)
-        max_size = max(sizes)
-        print(f"  Average chunk size: {avg_size:.0f} chars")
-        print(f"  Chunk size range: {min_size} - {max_size} chars")
+    if size_count:
+        print(f"  Average chunk size: {size_total / size_count:.0f} chars")
+        print(f"  Chunk size range: {size_min} - {size_max} chars")
     
     print("="*80 + "\n")
 
@@ -235,17 +365,22 @@ def ingest(repos: List[str], docs_dirs: List[str], db_dir: str,
            include_exts: set, exclude_dirs: set, exclude_exts: set,
            chunk_chars: int, chunk_overlap: int, verbose: bool, dry_run: bool = False):
     t0 = time.time()
-    embedding = OpenAIEmbeddings(model=EMBEDDING_MODEL)
-    splitter = LineAwareSplitter(chunk_size=chunk_chars, chunk_overlap=chunk_overlap)
 
     all_docs: List[Document] = []
-    component_counts: Dict[str, int] = {}
-    component_files: Dict[str, Set[str]] = {}
+    component_counts: Counter = Counter()
+    component_files: DefaultDict[str, Set[str]] = defaultdict(set)
     docs_stats: Dict[str, int] = {}
 
     total_included_files = 0
     total_skipped_files = 0
 
+    # Dry runs always process everything; real ingests only re-embed changed files
+    manifest = None if dry_run else Manifest(Path(db_dir) / MANIFEST_FILE, EMBEDDING_MODEL)
+    # Caches live in the DB directory being ingested; dry runs leave it untouched
+    component_cache_path = None if dry_run else str(Path(db_dir) / COMPONENT_CACHE_FILE)
+    if manifest is not None and manifest.model_changed:
+        LOG.info(f"Embedding model changed to {EMBEDDING_MODEL}; rebuilding the whole index")
+
     def process_root(root_str: str, kind: str):
         nonlocal total_included_files, total_skipped_files
         root = Path(root_str).resolve()
@@ -269,8 +404,12 @@ def ingest(repos: List[str], docs_dirs: List[str], db_dir: str,
         total_included_files += len(included)
         total_skipped_files += len(skipped)
         LOG.info(f"[{kind}] {root} → files included: {len(included)}, skipped: {len(skipped)}")
+        if manifest is not None:
+            included = [p for p in included if manifest.is_dirty(p)]
+            LOG.info(f"[{kind}] {len(included)} files changed since last ingest")
         docs = build_documents(included, kind, project_root=root,
-                               component_counts=component_counts, component_files=component_files, docs_stats=docs_stats)
+                               component_counts=component_counts, component_files=component_files, docs_stats=docs_stats,
+                               component_cache_path=component_cache_path)
         all_docs.extend(docs)
         if verbose:
             LOG.debug(f"[{kind}] sample included: {included[:5]}")
@@ -285,12 +424,12 @@ def ingest(repos: List[str], docs_dirs: List[str], db_dir: str,
     examples_root = Path("./examples")
     if examples_root.exists():
         LOG.info(f"[examples] Processing examples folder: {examples_root}")
-        example_docs = []
-        for example_dir in examples_root.iterdir():
-            if example_dir.is_dir() and not example_dir.name.startswith('.'):
-                LOG.info(f"[examples] Processing example: {example_dir.name}")
-                docs = process_example_project(example_dir, project_root=Path("."))
-                example_docs.extend(docs)
+        example_dirs = sorted(
+            d for d in examples_root.iterdir() if d.is_dir() and not d.name.startswith('.')
+        )
+        LOG.info(f"[examples] Processing examples: {', '.join(d.name for d in example_dirs)}")
+        example_docs = build_example_documents(example_dirs, project_root=Path("."), manifest=manifest,
+                                               db_dir=db_dir, dry_run=dry_run)
         all_docs.extend(example_docs)
         LOG.info(f"[examples] Processed {len(example_docs)} example documents")
 
@@ -305,44 +444,15 @@ def ingest(repos: List[str], docs_dirs: List[str], db_dir: str,
     if docs_stats:
         LOG.info(f"Docs stats: pages={docs_stats.get('pages',0)}, sections={docs_stats.get('sections',0)}, titled_pages={docs_stats.get('titled_pages',0)}")
 
-    # Apply different chunking strategies based on file type
-    chunks = []
-    for doc in all_docs:
-        ext = doc.metadata.get("ext", "").lower()
-        relpath = doc.metadata.get("relpath", "")
-        kind = doc.metadata.get("kind", "")
-        
-        # Special handling for interface definition files - keep them as single chunks
-        if any(pattern in relpath for pattern in PROPS_FILE_PATTERNS):
-            # Keep interface files as single chunks to preserve complete definitions
-            chunks.append(doc)
-        # Use larger chunks for examples to keep complete implementations together
-        elif kind == "example":
-            example_splitter = LineAwareSplitter(chunk_size=EXAMPLE_CHUNK_CHARS, chunk_overlap=EXAMPLE_CHUNK_OVERLAP)
-            example_chunks = example_splitter.split_documents([doc])
-            chunks.extend(example_chunks)
-        # Use larger chunks for documentation to keep complete examples
-        elif kind == "docs" or ext in {".md", ".mdx"}:
-            docs_splitter = LineAwareSplitter(chunk_size=DOCS_CHUNK_CHARS, chunk_overlap=DOCS_CHUNK_OVERLAP)
-            docs_chunks = docs_splitter.split_documents([doc])
-            chunks.extend(docs_chunks)
-        # Use larger chunks for TypeScript files to keep interfaces together
-        elif ext in {".ts", ".tsx"}:
-            ts_splitter = LineAwareSplitter(chunk_size=TS_CHUNK_CHARS, chunk_overlap=TS_CHUNK_OVERLAP)
-            ts_chunks = ts_splitter.split_documents([doc])
-            chunks.extend(ts_chunks)
-        else:
-            # Use default chunking for other files
-            default_chunks = splitter.split_documents([doc])
-            chunks.extend(default_chunks)
-    
-    LOG.info(f"Chunked into {len(chunks)} segments")
+    LOG.info("Chunking strategies:")
     LOG.info(f"  - Default: ≈{chunk_chars} chars, overlap {chunk_overlap}")
     LOG.info(f"  - TypeScript: ≈{TS_CHUNK_CHARS} chars, overlap {TS_CHUNK_OVERLAP}")
     LOG.info(f"  - Documentation: ≈{DOCS_CHUNK_CHARS} chars, overlap {DOCS_CHUNK_OVERLAP}")
     LOG.info(f"  - Examples: ≈{EXAMPLE_CHUNK_CHARS} chars, overlap {EXAMPLE_CHUNK_OVERLAP}")
 
     if dry_run:
+        chunks = list(iter_chunks(all_docs, chunk_chars, chunk_overlap))
+        LOG.info(f"Chunked into {len(chunks)} segments")
         LOG.info("DRY RUN: Skipping database writes")
         print_document_summary(chunks, component_counts, component_files, docs_stats)
         dt = time.time() - t0
@@ -352,7 +462,32 @@ def ingest(repos: List[str], docs_dirs: List[str], db_dir: str,
 
     # Use database abstraction
     database = create_database(db_dir=db_dir)
-    database.add_documents(chunks)
+    stale = set()
+    # An index without a manifest predates incremental ingest: its chunks have random IDs
+    # (examples no path at all), so they can't be replaced per file and are rebuilt instead
+    rebuild = manifest.model_changed
+    if manifest.missing and database.get_collection_info().get("document_count", 0) > 0:
+        LOG.info("Existing index has no manifest; rebuilding the whole index")
+        rebuild = True
+    if rebuild:
+        # The cache file is removed with the directory
+        close_component_caches()
+        database.clear()
+    else:
+        stale = manifest.dirty | manifest.removed()
+        if stale:
+            database.delete_paths(sorted(stale))
+    if all_docs or stale:
+        # Cached answers may cite content that just changed
+        database.answer_cache.clear()
+    if all_docs:
+        total_chunks = stream_to_database(database, iter_chunks(all_docs, chunk_chars, chunk_overlap))
+        LOG.info(f"Chunked and ingested {total_chunks} segments")
+    else:
+        LOG.info("No changed files; index is up to date")
+    if all_docs or stale or not database.has_lexical_index():
+        database.build_lexical_index()
+    manifest.save()
 
     dt = time.time() - t0
     LOG.info(f"Ingest complete in {dt:.1f}s. DB: {db_dir}")
@@ -381,7 +516,10 @@ def main():
     parser.add_argument("--verbose", action="store_true", help="Verbose logs")
     parser.add_argument("--dry-run", action="store_true", help="Dry run mode - no database writes or permanent changes")
     parser.add_argument("--debug-retrieval", action="store_true", help="Debug mode - show retrieved documents before LLM processing")
-    parser.add_argument("--fast", action="store_true", help="Use fast similarity search instead of SelfQueryRetriever")
+    parser.add_argument("--fast", action="store_true", help="Use plain vector similarity search instead of hybrid retrieval")
+    parser.add_argument("--ann-profile", choices=sorted(ANN_PROFILES), default=None,
+                        help="HNSW search breadth: fast (ef=20), balanced (ef=64), recall-max (ef=200); "
+                             f"saved on the collection for later queries (created with {DEFAULT_ANN_PROFILE})")
     args = parser.parse_args()
 
     if args.verbose:
@@ -431,7 +569,8 @@ def main():
             question=args.ask,
             db_dir=args.db,
             debug_retrieval=args.debug_retrieval,
-            use_fast_search=args.fast
+            use_fast_search=args.fast,
+            ann_profile=args.ann_profile
         )
         dt = time.time() - t0
         
@@ -2,15 +2,22 @@
 Source code processing and AST-based component extraction
 """
 
+import functools
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import sys
+from collections import Counter
 from pathlib import Path
-from typing import List, Dict, Set, Tuple
+from typing import TYPE_CHECKING, DefaultDict, List, Dict, Optional, Set, Tuple
 
-from langchain.schema import Document
-from tree_sitter import Language, Parser, Query
-import tree_sitter_typescript as ts_typescript
-import tree_sitter_javascript as ts_javascript
+from utils import LOG, extract_css_components, infer_components_from_text, path_key, read_file_bytes
+from config import COMPONENT_CACHE_VERSION, AST_MAX_BYTES
 
-from utils import LOG, extract_css_components, infer_components_from_text
+if TYPE_CHECKING:
+    from langchain.schema import Document
 
 # ----------------------------
 # Tree-sitter Queries (extracted constants)
@@ -100,186 +107,360 @@ JS_JSX_QUERY = """
 """
 
 ADDITIONAL_PATTERNS_QUERY = """
-; React.memo pattern
-(call_expression
+; React.memo pattern (predicates sit inside the pattern so they filter its matches)
+((call_expression
   function: (member_expression
     object: (identifier) @react
     property: (property_identifier) @memo)
   arguments: (arguments
     (identifier) @memo.component))
-(#eq? @react "React")
-(#eq? @memo "memo")
+ (#eq? @react "React")
+ (#eq? @memo "memo"))
 
 ; forwardRef pattern
-(call_expression
+((call_expression
   function: (identifier) @forwardRef
   arguments: (arguments
     (identifier) @ref.component))
-(#eq? @forwardRef "forwardRef")
+ (#eq? @forwardRef "forwardRef"))
 
-; Direct const Component = () => pattern
-(lexical_declaration
-  (variable_declarator
-    name: (identifier) @direct.component
-    value: (arrow_function)))
+; Direct const Component = () => pattern, top-level PascalCase declarations only
+(program
+  (lexical_declaration
+    (variable_declarator
+      name: (identifier) @direct.component
+      value: (arrow_function)))
+  (#match? @direct.component "^[A-Z]"))
 """
 
 # ----------------------------
 # Tree-sitter Setup
 # ----------------------------
-def setup_parsers():
-    """Initialize Tree-sitter parsers for TypeScript and JavaScript"""
-    # Build languages
-    TS_LANGUAGE = Language(ts_typescript.language_typescript())
-    TSX_LANGUAGE = Language(ts_typescript.language_tsx())
-    JS_LANGUAGE = Language(ts_javascript.language())
-    JSX_LANGUAGE = Language(ts_javascript.language())
+# Tree-sitter and its grammars are imported on first use, so importing this module stays cheap.
+# .js and .jsx share the JavaScript grammar, which includes JSX.
+AST_EXTS = frozenset({'.ts', '.tsx', '.js', '.jsx'})
+
+@functools.lru_cache(maxsize=None)
+def _languages() -> Dict[str, Tuple]:
+    """Extension -> (Language, main query string), built once"""
+    from tree_sitter import Language
+    import tree_sitter_typescript as ts_typescript
+    import tree_sitter_javascript as ts_javascript
     
-    parsers = {
-        '.ts': Parser(TS_LANGUAGE),
-        '.tsx': Parser(TSX_LANGUAGE),
-        '.js': Parser(JS_LANGUAGE),
-        '.jsx': Parser(JSX_LANGUAGE)
+    ts_language = Language(ts_typescript.language_typescript())
+    tsx_language = Language(ts_typescript.language_tsx())
+    js_language = Language(ts_javascript.language())
+    return {
+        '.ts': (ts_language, TS_TSX_QUERY),
+        '.tsx': (tsx_language, TS_TSX_QUERY),
+        '.js': (js_language, JS_JSX_QUERY),
+        '.jsx': (js_language, JS_JSX_QUERY),
     }
+
+@functools.lru_cache(maxsize=None)
+def setup_parsers():
+    """Initialize Tree-sitter parsers for TypeScript and JavaScript, one per grammar"""
+    from tree_sitter import Parser
     
-    return parsers
+    languages = _languages()
+    by_language = {}
+    for language, _ in languages.values():
+        if id(language) not in by_language:
+            by_language[id(language)] = Parser(language)
+    return {ext: by_language[id(language)] for ext, (language, _) in languages.items()}
 
-# Initialize parsers globally
-PARSERS = setup_parsers()
+@functools.lru_cache(maxsize=None)
+def compile_queries() -> Dict[str, object]:
+    """Compile one query per extension holding the main and additional patterns
+    
+    Running both pattern sets as a single query walks each tree once instead of twice.
+    Extensions whose queries fail to compile are left out and fall back to regex extraction.
+    """
+    from tree_sitter import Query
+    
+    queries = {}
+    for ext, (language, query_string) in _languages().items():
+        try:
+            queries[ext] = Query(language, query_string + ADDITIONAL_PATTERNS_QUERY)
+        except Exception as e:
+            LOG.warning(f"Could not compile Tree-sitter queries for {ext}, using regex extraction: {e}")
+    return queries
+
+# Captures in ADDITIONAL_PATTERNS_QUERY that name a component
+ADDITIONAL_COMPONENT_CAPTURES = frozenset({'memo.component', 'ref.component', 'direct.component'})
+# Every capture that names an export; helper captures used only by predicates
+# (@fc.type, @react, @memo, @forwardRef) are left out
+COMPONENT_CAPTURES = frozenset({
+    'function.name', 'class.name', 'const.name', 'export.name', 'default.export',
+    'interface.name', 'type.name', 'arrow.name', 'fc.name',
+}) | ADDITIONAL_COMPONENT_CAPTURES
+
+# Cheap pre-parse gate: files with none of these substrings (exports, the FC annotation,
+# React.memo / forwardRef wrappers) skip Tree-sitter and report no exports
+AST_MARKERS = (b"export", b"FC", b"memo", b"forwardRef")
 
 # ----------------------------
 # AST-based component extraction
 # ----------------------------
-def extract_components_with_ast(text: str, file_ext: str) -> Set[str]:
-    """Extract ALL exported names using Tree-sitter AST parsing (components, hooks, utilities, etc.)"""
+def extract_components_with_ast(text: str, file_ext: str, source: Optional[bytes] = None) -> Optional[Set[str]]:
+    """Extract ALL exported names using Tree-sitter AST parsing (components, hooks, utilities, etc.)
+    
+    Returns None when the file could not be parsed (or parsed with errors and yielded nothing),
+    so callers fall back to regex; an empty set means it parsed cleanly and has no exports. `source` is the file's UTF-8 bytes when the
+    caller already has them, saving a re-encode.
+    """
     components = set()
     
     # Skip if not a supported file type
-    if file_ext not in PARSERS:
+    if file_ext not in AST_EXTS:
+        return None
+    
+    if source is None:
+        source = text.encode("utf-8")
+    # Generated bundles are expensive to parse and rarely worth it; use the regex scan
+    if len(source) > AST_MAX_BYTES:
+        return None
+    # Files without any export-related marker have nothing worth indexing; skip the parse
+    if not any(marker in source for marker in AST_MARKERS):
         return components
     
     try:
-        parser = PARSERS[file_ext]
-        tree = parser.parse(bytes(text, "utf8"))
+        queries = compile_queries()
+        if file_ext not in queries:
+            return None
+        tree = setup_parsers()[file_ext].parse(source)
         
-        # Select appropriate query and language
-        if file_ext in ['.tsx', '.ts']:
-            query_string = TS_TSX_QUERY
-            query_lang = Language(ts_typescript.language_typescript() if file_ext == '.ts' else ts_typescript.language_tsx())
-        else:
-            query_string = JS_JSX_QUERY
-            query_lang = Language(ts_javascript.language())
+        # Execute main and additional patterns in one pass
+        captures = _resolve_query_runner()(queries[file_ext], tree.root_node)
         
-        # Execute main query
-        query = Query(query_lang, query_string)
-        captures = _execute_query_safely(query, tree.root_node)
-        
-        # Extract names from captures
+        # Extract names from captures; check the log level once, not per capture
+        debug = LOG.isEnabledFor(logging.DEBUG)
         for node, capture_name in captures:
-            name = node.text.decode('utf8')
+            if capture_name not in COMPONENT_CAPTURES:
+                continue
+            name = _node_name(source, node)
             if name and name.isidentifier():
                 components.add(name)
-                LOG.debug(f"Found export via AST ({capture_name}): {name}")
-        
-        # Execute additional patterns query
-        additional_query = Query(query_lang, ADDITIONAL_PATTERNS_QUERY)
-        additional_captures = _execute_query_safely(additional_query, tree.root_node)
-        
-        for node, capture_name in additional_captures:
-            if capture_name in ['memo.component', 'ref.component', 'direct.component']:
-                name = node.text.decode('utf8')
-                if name and name.isidentifier():
-                    components.add(name)
+                if not debug:
+                    continue
+                if capture_name in ADDITIONAL_COMPONENT_CAPTURES:
                     LOG.debug(f"Found export via AST pattern ({capture_name}): {name}")
+                else:
+                    LOG.debug(f"Found export via AST ({capture_name}): {name}")
+        
+        # Tree-sitter recovers from syntax errors instead of raising; an empty result from a
+        # damaged tree is not trustworthy, so let the regex scan have a go
+        if not components and tree.root_node.has_error:
+            return None
         
     except Exception as e:
         LOG.warning(f"AST parsing failed for {file_ext}, falling back to regex: {e}")
-        return infer_components_from_text(text)
+        return None
     
     return components
 
-def _execute_query_safely(query: Query, root_node) -> List[Tuple]:
-    """Safely execute tree-sitter query with fallback for different API versions"""
+def _node_name(source: bytes, node) -> str:
+    """Identifier text sliced from the parsed bytes; JS/TS identifiers are almost always ASCII"""
+    name = source[node.start_byte:node.end_byte]
+    return name.decode("ascii") if name.isascii() else name.decode("utf-8", errors="ignore")
+
+@functools.lru_cache(maxsize=None)
+def _resolve_query_runner():
+    """Pick the installed tree-sitter's capture API once; the runner returns (node, capture_name) pairs"""
+    from tree_sitter import Query
     try:
-        return query.captures(root_node)
-    except AttributeError:
-        try:
-            return query.execute(root_node)
-        except AttributeError:
-            LOG.debug("Tree-sitter API not compatible, skipping AST parsing")
-            return []
+        from tree_sitter import QueryCursor  # 0.25+: queries run through a cursor
+    except ImportError:
+        QueryCursor = None
+    if QueryCursor is not None:
+        def run(query, root_node) -> List[Tuple]:
+            captures = QueryCursor(query).captures(root_node)
+            return [(node, name) for name, nodes in captures.items() for node in nodes]
+        return run
+    if hasattr(Query, "captures"):
+        def run(query, root_node) -> List[Tuple]:
+            captures = query.captures(root_node)
+            if isinstance(captures, dict):  # 0.23+: {capture_name: [nodes]}
+                return [(node, name) for name, nodes in captures.items() for node in nodes]
+            return captures
+        return run
+    if hasattr(Query, "execute"):
+        return lambda query, root_node: query.execute(root_node)
+    LOG.debug("Tree-sitter API not compatible, skipping AST parsing")
+    return lambda query, root_node: []
 
 # ----------------------------
 # Enhanced component extraction with fallback
 # ----------------------------
-def infer_components_from_text_enhanced(text: str, file_path: Path) -> Set[str]:
+def infer_components_from_text_enhanced(text: str, file_path: Path,
+                                        source: Optional[bytes] = None) -> Set[str]:
     """
     Extract ALL exported names using AST parsing with regex fallback.
     This includes components, hooks (useXyz), utilities, constants, etc.
     """
     ext = file_path.suffix.lower()
     
-    # Try AST extraction first for supported file types
-    if ext in ['.ts', '.tsx', '.js', '.jsx']:
-        components = extract_components_with_ast(text, ext)
-        if components:
-            LOG.debug(f"Found {len(components)} exports via AST in {file_path.name}: {components}")
+    # Try AST extraction first for supported file types; a successful parse is authoritative,
+    # so files without exports don't pay for a regex scan as well
+    if ext in AST_EXTS:
+        components = extract_components_with_ast(text, ext, source)
+        if components is not None:
+            # Runs for every file; only build the message when it will be shown
+            if LOG.isEnabledFor(logging.DEBUG):
+                LOG.debug(f"Found {len(components)} exports via AST in {file_path.name}: {components}")
             return components
     
     # CSS-specific parsing for CSS files
     if ext in ['.css', '.scss']:
         css_components = extract_css_components(text)
         if css_components:
-            LOG.debug(f"Found {len(css_components)} CSS components in {file_path.name}: {css_components}")
+            if LOG.isEnabledFor(logging.DEBUG):
+                LOG.debug(f"Found {len(css_components)} CSS components in {file_path.name}: {css_components}")
             return css_components
     
-    # Fall back to regex for unsupported files or if AST parsing found nothing
+    # Fall back to regex for unsupported files or if AST parsing was not possible
     return infer_components_from_text(text)
 
+# ----------------------------
+# Component cache
+# ----------------------------
+class ComponentCache:
+    """Extracted component names persisted in SQLite, keyed by a hash of the file content"""
+    
+    def __init__(self, cache_path: str):
+        Path(cache_path).parent.mkdir(parents=True, exist_ok=True)
+        # Parse workers share the file; WAL lets readers proceed while one process writes
+        self._conn = sqlite3.connect(cache_path, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS ast_cache (hash BLOB PRIMARY KEY, components TEXT NOT NULL)"
+        )
+        self._conn.commit()
+    
+    @staticmethod
+    def key(source: bytes, ext: str) -> bytes:
+        return hashlib.sha256(f"{COMPONENT_CACHE_VERSION}\0{ext}\0".encode("utf-8") + source).digest()
+    
+    def get(self, key: bytes) -> Optional[List[str]]:
+        """Sorted component names, as stored"""
+        row = self._conn.execute("SELECT components FROM ast_cache WHERE hash = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+    
+    def put(self, key: bytes, components: List[str]) -> None:
+        # Misses already paid for a parse, so a per-row commit (no fsync under WAL) is cheap
+        self._conn.execute(
+            "INSERT OR REPLACE INTO ast_cache (hash, components) VALUES (?, ?)",
+            (key, json.dumps(components)),
+        )
+        self._conn.commit()
+    
+    def close(self) -> None:
+        self._conn.close()
+
+# Open caches by (pid, path): forked parse workers never share a connection
+_component_caches: Dict[Tuple[int, str], Optional[ComponentCache]] = {}
+
+def _component_cache(cache_path: str) -> Optional[ComponentCache]:
+    """This process's connection to the cache at `cache_path`, opened on first use"""
+    key = (os.getpid(), cache_path)
+    if key not in _component_caches:
+        try:
+            _component_caches[key] = ComponentCache(cache_path)
+        except sqlite3.Error as e:
+            LOG.warning(f"Component cache unavailable, extracting without it: {e}")
+            _component_caches[key] = None
+    return _component_caches[key]
+
+def close_component_caches() -> None:
+    """Close this process's cache connections, e.g. before the DB directory is removed"""
+    pid = os.getpid()
+    for key in [key for key in _component_caches if key[0] == pid]:
+        cache = _component_caches.pop(key)
+        if cache is not None:
+            cache.close()
+
+def extract_components_cached(text: str, source: bytes, file_path: Path,
+                              cache_path: Optional[str] = None) -> List[str]:
+    """Sorted infer_components_from_text_enhanced names, reusing results for unchanged file content
+    
+    Names are cached already sorted, so hits need no set building or sorting. Without a
+    `cache_path` (e.g. dry runs) nothing is read from or written to disk.
+    """
+    cache = _component_cache(cache_path) if cache_path else None
+    if cache is None:
+        return sorted(infer_components_from_text_enhanced(text, file_path, source))
+    key = ComponentCache.key(source, file_path.suffix.lower())
+    try:
+        components = cache.get(key)
+    except sqlite3.Error as e:
+        LOG.debug(f"Component cache read failed for {file_path}: {e}")
+        components = None
+    if components is None:
+        components = sorted(infer_components_from_text_enhanced(text, file_path, source))
+        try:
+            cache.put(key, components)
+        except sqlite3.Error as e:
+            LOG.debug(f"Component cache write failed for {file_path}: {e}")
+    return components
+
 # ----------------------------
 # Source code processing
 # ----------------------------
 def process_source_file(
     p: Path, 
     project_root: Path,
-    component_counts: Dict[str, int], 
-    component_files: Dict[str, Set[str]]
-) -> List[Document]:
-    """Process a single source code file and return Document instances"""
+    component_counts: Counter, 
+    component_files: DefaultDict[str, Set[str]],
+    component_cache_path: Optional[str] = None
+) -> List["Document"]:
+    """Process a single source code file and return Document instances
+    
+    Extracted components are cached at `component_cache_path` when one is given.
+    """
+    from langchain.schema import Document
+    
     docs = []
     
-    try:
-        text = p.read_text(encoding="utf-8", errors="ignore")
-    except Exception:
-        return docs
-
     ext = p.suffix.lower()
     if ext in {".md", ".mdx"}:
         return docs  # Skip documentation files in source processing
 
+    # Read bytes once: they feed the parser and cache key, the decoded text the Document.
+    # Oversized (generated) and binary files are skipped before being loaded.
+    try:
+        source = read_file_bytes(p)
+    except Exception:
+        return docs
+    if source is None:
+        return docs
+    text = source.decode("utf-8", errors="ignore")
+    if "\r" in text:
+        # Same newline handling as read_text
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+
     # CODE: extract components using AST with regex fallback
-    components = infer_components_from_text_enhanced(text, p)
+    comp_list = extract_components_cached(text, source, p, component_cache_path)
 
+    relpath = str(p.relative_to(project_root))
     meta = {
-        "path": str(p.resolve()),
-        "relpath": str(p.relative_to(project_root)),
+        "path": path_key(p),
+        "relpath": relpath,
         "kind": "code",
         "ext": ext,
     }
-    if components:
-        comp_list = sorted(components)
+    if comp_list:
         meta["component"] = comp_list[0]
-        meta["components"] = ", ".join(comp_list)  # Convert list to string for ChromaDB
-        relpath = str(p.relative_to(project_root))
-        for c in comp_list:
-            # Skip boolean values and other non-component names
-            if c is True or c is False or not isinstance(c, str):
-                continue
-            component_counts[c] = component_counts.get(c, 0) + 1
-            component_files.setdefault(c, set()).add(relpath)
+        # Kept as a tuple of interned names (they recur across files); joined into a string for ChromaDB at write time
+        meta["components"] = tuple(sys.intern(c) for c in comp_list)
+        # Skip boolean values and other non-component names
+        names = [c for c in comp_list if isinstance(c, str)]
+        component_counts.update(names)
+        for c in names:
+            component_files[c].add(relpath)
     else:
         # Ensure components field is always present
-        meta["components"] = ""
+        meta["components"] = ()
 
     docs.append(Document(page_content=text, metadata=meta))
     return docs
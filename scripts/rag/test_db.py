@@ -0,0 +1,117 @@
+"""
+Regression checks for vector database maintenance
+
+Run with: python -m unittest test_db (from scripts/rag)
+"""
+
+import importlib.util
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+HAS_DEPS = all(
+    importlib.util.find_spec(name) is not None
+    for name in ("chromadb", "langchain_chroma", "langchain_community", "rank_bm25")
+)
+
+
+@unittest.skipUnless(HAS_DEPS, "chromadb / langchain not installed")
+class ClearWithFilterTest(unittest.TestCase):
+    def setUp(self):
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+        import db
+
+        self.tmp = tempfile.TemporaryDirectory()
+        root = Path(self.tmp.name)
+        self.src = root / "src"
+        self.src.mkdir()
+        (self.src / "Button.ts").write_text("export const Button = 'button';\n")
+        (self.src / "Card.ts").write_text("export const Card = 'card';\n")
+        self.db_dir = str(root / "db")
+
+        # Ingest looks for ./examples; run from the temporary directory
+        self.cwd = os.getcwd()
+        os.chdir(root)
+
+        fake = DeterministicFakeEmbedding(size=16)
+        embeddings = db.CachedEmbeddings(fake, model="fake", cache_path=str(root / "embeddings.sqlite3"))
+        patcher = mock.patch.object(db, "_get_embeddings", return_value=embeddings)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        db._get_vectorstore.cache_clear()
+        db._get_query_cache.cache_clear()
+
+    def tearDown(self):
+        import db
+        db._get_vectorstore.cache_clear()
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def ingest(self):
+        from run import ingest
+        ingest([str(self.src)], [], self.db_dir, {".ts"}, set(), set(),
+               chunk_chars=1000, chunk_overlap=0, verbose=False)
+
+    def relpaths(self, database):
+        data = database.vectorstore._collection.get(include=["metadatas"])
+        return sorted(meta["relpath"] for meta in data["metadatas"])
+
+    def lexical_relpaths(self, database):
+        return sorted(d.metadata["relpath"] for d in database.lexical_retriever.docs)
+
+    def test_clear_then_reingest_restores_rows(self):
+        from db import create_database
+
+        self.ingest()
+        database = create_database(db_dir=self.db_dir)
+        self.assertEqual(self.relpaths(database), ["Button.ts", "Card.ts"])
+
+        database.clear(where={"relpath": "Card.ts"})
+        self.assertEqual(self.relpaths(database), ["Button.ts"])
+        self.assertEqual(self.lexical_relpaths(create_database(db_dir=self.db_dir)), ["Button.ts"])
+
+        self.ingest()
+        database = create_database(db_dir=self.db_dir)
+        self.assertEqual(self.relpaths(database), ["Button.ts", "Card.ts"])
+        self.assertEqual(self.lexical_relpaths(database), ["Button.ts", "Card.ts"])
+
+
+@unittest.skipUnless(HAS_DEPS, "chromadb / langchain not installed")
+class AnnProfileTest(unittest.TestCase):
+    def setUp(self):
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+        import db
+
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_dir = str(Path(self.tmp.name) / "db")
+        patcher = mock.patch.object(db, "_get_embeddings", return_value=DeterministicFakeEmbedding(size=16))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        db._get_vectorstore.cache_clear()
+
+    def tearDown(self):
+        import db
+        db._get_vectorstore.cache_clear()
+        self.tmp.cleanup()
+
+    def collection(self, ann_profile):
+        import db
+        db._get_vectorstore.cache_clear()
+        return db.create_database(db_dir=self.db_dir, ann_profile=ann_profile).vectorstore._collection
+
+    def test_profile_changes_ef_search_and_keeps_distance(self):
+        from config import ANN_PROFILES, HNSW_SPACE
+
+        self.collection("fast")
+        for profile in ("recall-max", None):
+            collection = self.collection(profile)
+            self.assertEqual(collection.metadata["hnsw:space"], HNSW_SPACE)
+            configuration = getattr(collection, "configuration", None)
+            if configuration:
+                self.assertEqual(configuration["hnsw"]["ef_search"], ANN_PROFILES["recall-max"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+"""
+Regression checks for AST component extraction
+
+Run with: python -m unittest test_source (from scripts/rag)
+"""
+
+import importlib.util
+import unittest
+from pathlib import Path
+
+from source import extract_components_with_ast, infer_components_from_text_enhanced
+
+HAS_TREE_SITTER = importlib.util.find_spec("tree_sitter") is not None
+
+FIXTURE = """
+import React, { forwardRef } from 'react';
+
+const Inner = () => <div />;
+export const Memo = React.memo(Inner);
+export const Ref = forwardRef(Base);
+const Typed: FC = () => null;
+
+function run() {
+  foo.bar(x);
+  baz(y);
+  const handleSend = () => send(msg);
+}
+"""
+
+
+@unittest.skipUnless(HAS_TREE_SITTER, "tree-sitter not installed")
+class ExtractComponentsWithAstTest(unittest.TestCase):
+    def test_call_arguments_are_not_components(self):
+        for ext in (".tsx", ".jsx", ".js"):
+            with self.subTest(ext=ext):
+                names = extract_components_with_ast(FIXTURE, ext)
+                self.assertEqual(names, {"Inner", "Memo", "Ref", "Base", "Typed"})
+
+    def test_empty_result_from_damaged_tree_falls_back(self):
+        self.assertIsNone(extract_components_with_ast("export const Card = () => <div>;}}}", ".tsx"))
+        self.assertEqual(extract_components_with_ast("const a = 1;", ".tsx"), set())
+        self.assertEqual(infer_components_from_text_enhanced("export const Card = () => <div>;}}}",
+                                                             Path("Card.tsx")), {"Card"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -6,9 +6,6 @@ This file demonstrates how to use the RAG system to query your codebase.
 
 import os
 from pathlib import Path
-from run import ingest
-from retrieve import make_chain
-from db import create_database
 from config import (
     LLM_MODEL, EMBEDDING_MODEL, RETRIEVER_K, DEFAULT_REPO_PATHS, DEFAULT_DOCS_PATHS,
     DEFAULT_INCLUDE_EXTS, DEFAULT_EXCLUDE_DIRS, DEFAULT_EXCLUDE_EXTS,
@@ -16,6 +13,10 @@ from config import (
 )
 
 def main():
+    # Imported here: these pull in Chroma, LangChain and OpenAI, which take seconds to load
+    from run import ingest
+    from retrieve import make_chain
+    
     # Set up your OpenAI API key
     os.environ["OPENAI_API_KEY"] = "your-api-key-here"
     
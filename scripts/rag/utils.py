@@ -2,14 +2,25 @@
 Global utilities for RAG processing
 """
 
+import atexit
+import functools
+import hashlib
+import json
 import logging
+import os
 import re
+import threading
+import time
+from itertools import islice
 from pathlib import Path
-from typing import List, Dict, Optional, Set
+from typing import Iterable, Iterator, List, Dict, Optional, Set, Tuple, TypeVar
 
+import httpx
 import pathspec
 import frontmatter
 
+from config import MAX_FILE_BYTES, BINARY_SNIFF_BYTES, HTTP_MAX_CONNECTIONS, HTTP_TIMEOUT_SECONDS
+
 # ----------------------------
 # Logging
 # ----------------------------
@@ -20,10 +31,204 @@ handler.setFormatter(fmt)
 LOG.addHandler(handler)
 LOG.setLevel(logging.INFO)
 
+# ----------------------------
+# Batching
+# ----------------------------
+T = TypeVar("T")
+
+def batched(items: Iterable[T], size: int) -> Iterator[List[T]]:
+    """Yield successive lists of at most `size` items"""
+    it = iter(items)
+    while batch := list(islice(it, size)):
+        yield batch
+
+class RateLimiter:
+    """Thread-safe token bucket allowing `rate` acquisitions per `period` seconds"""
+    
+    def __init__(self, rate: int, period: float = 60.0):
+        self.capacity = float(rate)
+        self.tokens = float(rate)
+        self.fill_rate = rate / period
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def acquire(self) -> None:
+        """Block until a token is available, then take it"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.fill_rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.fill_rate
+            time.sleep(wait)
+
+# ----------------------------
+# HTTP
+# ----------------------------
+@functools.lru_cache(maxsize=None)
+def get_http_client() -> httpx.Client:
+    """Process-wide HTTP/2 client, so OpenAI requests reuse connections instead of re-handshaking"""
+    client = httpx.Client(
+        http2=True,
+        limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_CONNECTIONS),
+        timeout=HTTP_TIMEOUT_SECONDS,
+    )
+    atexit.register(client.close)
+    return client
+
+# ----------------------------
+# Citation tags
+# ----------------------------
+# (metadata key, tag label) for example chunks, in tag order
+EXAMPLE_TAG_FIELDS = (
+    ("example_type", "example"),
+    ("build_tool", "build"),
+    ("framework", "framework"),
+    ("complexity", "complexity"),
+    ("file_type", "file_type"),
+)
+
+def render_tag(m: Dict) -> str:
+    """Citation header for a chunk in the prompt; depends only on metadata fixed at ingest"""
+    kind = m.get("kind", "unknown")
+    ext = m.get("ext", "")
+    component = m.get("component", "")
+    
+    # Build tag with metadata
+    tag_parts = [kind]
+    if ext:
+        tag_parts.append(ext)
+    if component:
+        tag_parts.append(f"component={component}")
+    
+    # Add example-specific metadata
+    if kind == "example":
+        for key, label in EXAMPLE_TAG_FIELDS:
+            value = m.get(key)
+            if value:
+                tag_parts.append(f"{label}={value}")
+        key_features = m.get("key_features")
+        if key_features:
+            # key_features is now a string, so just show first part
+            features_str = key_features.split(", ")[:3]  # Show first 3 features
+            tag_parts.append(f"features={','.join(features_str)}")
+    
+    return f"- {m.get('relpath', 'unknown')}[{', '.join(tag_parts)}]]\nContent:\n"
+
+# ----------------------------
+# File reading
+# ----------------------------
+def path_key(p: Path) -> str:
+    """Absolute path string identifying a file in metadata and the manifest
+    
+    Ingest walks roots that were resolved once, so their absolute paths are used as-is
+    rather than paying for a realpath per file; relative paths are still resolved.
+    """
+    return str(p) if p.is_absolute() else str(p.resolve())
+
+def read_file_bytes(p: Path) -> Optional[bytes]:
+    """Read a text file's raw bytes, returning None for oversized or binary files
+    
+    Size is checked before reading, so oversized files are never loaded.
+    """
+    size = p.stat().st_size
+    if size > MAX_FILE_BYTES:
+        LOG.info(f"Skipping {p}: {size} bytes exceeds limit of {MAX_FILE_BYTES}")
+        return None
+    data = p.read_bytes()
+    if b"\0" in data[:BINARY_SNIFF_BYTES]:
+        LOG.debug(f"Skipping binary file {p}")
+        return None
+    return data
+
+def read_text_file(p: Path) -> Optional[str]:
+    """Read a UTF-8 text file, returning None for oversized or binary files"""
+    data = read_file_bytes(p)
+    return None if data is None else data.decode("utf-8", errors="ignore")
+
+# ----------------------------
+# Incremental ingest manifest
+# ----------------------------
+class Manifest:
+    """Per-file (mtime_ns, size, sha1) fingerprints recorded by the last ingest"""
+    
+    def __init__(self, path: Path, embedding_model: str):
+        self.path = path
+        self.embedding_model = embedding_model
+        self.files: Dict[str, list] = {}
+        self.dirty: Set[str] = set()
+        self.seen: Set[str] = set()
+        # Vectors from another model can't be mixed in; callers rebuild from scratch
+        self.model_changed = False
+        # No record of a previous ingest; any existing index can't be updated file by file
+        self.missing = not path.exists()
+        if not self.missing:
+            try:
+                data = json.loads(path.read_text())
+                if data.get("embedding_model") == embedding_model:
+                    self.files = data.get("files", {})
+                else:
+                    self.model_changed = True
+            except Exception as e:
+                LOG.warning(f"Could not read manifest at {path}: {e}")
+    
+    def is_dirty(self, p: Path) -> bool:
+        """Return True if the file is new or changed since the last ingest"""
+        key = path_key(p)
+        self.seen.add(key)
+        try:
+            st = p.stat()
+            previous = self.files.get(key)
+            if previous and previous[0] == st.st_mtime_ns and previous[1] == st.st_size:
+                return False
+            digest = hashlib.sha1(p.read_bytes()).hexdigest()
+        except OSError:
+            return True
+        self.files[key] = [st.st_mtime_ns, st.st_size, digest]
+        if previous and previous[2] == digest:
+            return False  # Touched but content unchanged
+        self.dirty.add(key)
+        return True
+    
+    def mark_dirty(self, p: Path) -> None:
+        """Re-index an unchanged file, e.g. when metadata derived from other files changed"""
+        self.dirty.add(path_key(p))
+    
+    def forget(self, keys: Iterable[str]) -> None:
+        """Drop fingerprints so the next ingest treats those files as new, and persist the rest"""
+        for key in keys:
+            self.files.pop(key, None)
+        # Nothing was walked; every remaining entry is still indexed
+        self.seen.update(self.files)
+        self.save()
+    
+    def removed(self) -> Set[str]:
+        """Paths indexed by the last ingest that were not seen in this one"""
+        return set(self.files) - self.seen
+    
+    def save(self) -> None:
+        """Persist fingerprints of the files seen in this ingest"""
+        data = {
+            "embedding_model": self.embedding_model,
+            "files": {k: v for k, v in self.files.items() if k in self.seen},
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(data))
+        os.replace(tmp, self.path)
+
 # ----------------------------
 # .gitignore
 # ----------------------------
 def load_gitignore(root: Path, exclude_exts: set = None) -> Optional[pathspec.PathSpec]:
+    """Compiled ignore spec for a root; cached so repeated calls reuse the parse"""
+    return _compile_ignore_spec(root, frozenset(exclude_exts or ()))
+
+@functools.lru_cache(maxsize=16)
+def _compile_ignore_spec(root: Path, exclude_exts: frozenset) -> Optional[pathspec.PathSpec]:
     patterns = []
     
     # Load .gitignore if it exists
@@ -37,7 +242,7 @@ def load_gitignore(root: Path, exclude_exts: set = None) -> Optional[pathspec.Pa
     
     # Add extension exclusions as patterns
     if exclude_exts:
-        for ext in exclude_exts:
+        for ext in sorted(exclude_exts):
             if ext.startswith('.'):
                 patterns.append(f"**/*{ext}*")
     
@@ -53,95 +258,91 @@ def load_gitignore(root: Path, exclude_exts: set = None) -> Optional[pathspec.Pa
             LOG.warning(f"Could not parse patterns: {e}")
     return None
 
-def is_ignored(relpath: Path, spec: Optional[pathspec.PathSpec]) -> bool:
-    if spec is None:
-        return False
-    return spec.match_file(str(relpath.as_posix()))
-
 # ----------------------------
 # File iteration with ignores
 # ----------------------------
 def iter_files(root: Path, include_exts: set, exclude_dirs: set, exclude_exts: set,
                spec: Optional[pathspec.PathSpec]) -> tuple[List[Path], List[Path]]:
-    included: List[Path] = []
+    """Walk root, returning (included, skipped) files
+    
+    Excluded and ignored directories are pruned during the walk, so their contents are never
+    listed; paths are handled as strings and only survivors become Path objects.
+    """
+    candidates: List[Tuple[str, str]] = []  # (absolute path, posix relpath)
     skipped: List[Path] = []
-    for p in root.rglob("*"):
-        try:
-            if not p.is_file():
-                continue
-            if any(part in exclude_dirs for part in p.parts):
-                skipped.append(p); continue
+    root_str = str(root)
+    for dirpath, dirs, files in os.walk(root_str):
+        rel_dir = os.path.relpath(dirpath, root_str)
+        rel_prefix = "" if rel_dir == "." else rel_dir.replace(os.sep, "/") + "/"
+        dirs[:] = [d for d in dirs if d not in exclude_dirs]
+        if spec is not None:
+            # Ignored directories are pruned whole, once each: as in git, files below an
+            # ignored directory can't be re-included, so none of them need matching
+            dirs[:] = [d for d in dirs if not spec.match_file(f"{rel_prefix}{d}/")]
+        for name in files:
+            path = os.path.join(dirpath, name)
             # Check file extensions
-            ext = p.suffix.lower()
+            ext = os.path.splitext(name)[1].lower()
             if (include_exts and ext not in include_exts):
-                skipped.append(p); continue
-            rel = p.relative_to(root)
-            if is_ignored(rel, spec):
-                skipped.append(p); continue
-            included.append(p)
-        except Exception:
-            skipped.append(p)
+                skipped.append(Path(path)); continue
+            if not os.path.isfile(path):
+                continue  # Broken symlinks, sockets, etc.
+            candidates.append((path, rel_prefix + name))
+    if spec is None:
+        return [Path(path) for path, _ in candidates], skipped
+    # Match all candidates against the ignore spec in one call
+    ignored = set(spec.match_files(rel for _, rel in candidates))
+    included: List[Path] = []
+    for path, rel in candidates:
+        (skipped if rel in ignored else included).append(Path(path))
     return included, skipped
 
 # ----------------------------
 # Component extraction utilities
 # ----------------------------
+# CSS custom properties (design tokens), class selectors and layer names
+CSS_PROP_RE = re.compile(r'--([a-zA-Z][a-zA-Z0-9-]*):')
+CSS_CLASS_RE = re.compile(r'\.([a-zA-Z][a-zA-Z0-9-_]*)')
+CSS_LAYER_RE = re.compile(r'@layer\s+([a-zA-Z][a-zA-Z0-9-_]*)')
+
+# Export statements naming a PascalCase component, one alternative per export form.
+# Every alternative captures the name in exactly one group, so the text is scanned once;
+# only "export" is consumed, so statements starting inside a matched name are still found.
+EXPORT_RE = re.compile(
+    r'export(?='
+    r'\s+(?:default\s+)?(?:function|const|class)\s+([A-Z][A-Za-z0-9]*)\b'  # export function Component
+    r'|\s+{\s*([A-Z][A-Za-z0-9]*)\s*}'  # export { Component }
+    r'|\s+{\s*([A-Z][A-Za-z0-9]*)\s+as\s+[A-Za-z0-9]+\s*}'  # export { Component as Other }
+    r'|\s+(?:default\s+)?(?:const|let|var)\s+([A-Z][A-Za-z0-9]*)\s*='  # export const Component =
+    r'|\s+interface\s+([A-Z][A-Za-z0-9]*)\b'  # export interface Component
+    r'|\s+type\s+([A-Z][A-Za-z0-9]*)\b'  # export type Component
+    r')',
+    re.MULTILINE,
+)
+
+@functools.lru_cache(maxsize=4096)
+def kebab_to_pascal(token: str) -> str:
+    """Design-system tokens recur across stylesheets (--color-*, --spacing-*), so results are memoized"""
+    return ''.join(word.capitalize() for word in token.split('-'))
+
 def extract_css_components(text: str) -> Set[str]:
     """Extract CSS custom properties, classes, and design tokens"""
-    components = set()
-    
-    # CSS custom properties (design tokens)
-    css_prop_pattern = r'--([a-zA-Z][a-zA-Z0-9-]*):'
-    css_props = re.findall(css_prop_pattern, text)
-    for prop in css_props:
-        # Convert kebab-case to PascalCase for consistency
-        pascal_case = ''.join(word.capitalize() for word in prop.split('-'))
-        components.add(pascal_case)
-    
-    # CSS class selectors
-    class_pattern = r'\.([a-zA-Z][a-zA-Z0-9-_]*)'
-    classes = re.findall(class_pattern, text)
-    for cls in classes:
-        # Convert kebab-case to PascalCase
-        pascal_case = ''.join(word.capitalize() for word in cls.split('-'))
-        components.add(pascal_case)
-    
-    # CSS layer names
-    layer_pattern = r'@layer\s+([a-zA-Z][a-zA-Z0-9-_]*)'
-    layers = re.findall(layer_pattern, text)
-    for layer in layers:
-        pascal_case = ''.join(word.capitalize() for word in layer.split('-'))
-        components.add(pascal_case)
+    # CSS custom properties (design tokens), class selectors and layer names.
+    # Tokens repeat heavily (every var(--x) use, every rule for a class), so collect
+    # the distinct raw tokens first and convert each once.
+    tokens = set(CSS_PROP_RE.findall(text))
+    tokens.update(CSS_CLASS_RE.findall(text))
+    tokens.update(CSS_LAYER_RE.findall(text))
     
-    return components
+    # Convert kebab-case to PascalCase for consistency
+    return {kebab_to_pascal(token) for token in tokens}
 
 def infer_components_from_text(text: str) -> Set[str]:
     """Extract component names from export statements using regex"""
-    components = set()
-    
-    # Regex patterns for different export types
-    patterns = [
-        r'export\s+(?:default\s+)?(?:function|const|class)\s+([A-Z][A-Za-z0-9]*)\b',  # export function Component
-        r'export\s+{\s*([A-Z][A-Za-z0-9]*)\s*}',  # export { Component }
-        r'export\s+{\s*([A-Z][A-Za-z0-9]*)\s+as\s+[A-Za-z0-9]+\s*}',  # export { Component as Other }
-        r'export\s+(?:default\s+)?(?:const|let|var)\s+([A-Z][A-Za-z0-9]*)\s*=',  # export const Component =
-        r'export\s+interface\s+([A-Z][A-Za-z0-9]*)\b',  # export interface Component
-        r'export\s+type\s+([A-Z][A-Za-z0-9]*)\b',  # export type Component
-    ]
-    
-    for pattern in patterns:
-        matches = re.findall(pattern, text, re.MULTILINE)
-        for match in matches:
-            if isinstance(match, tuple):
-                # Handle groups in regex
-                for group in match:
-                    if re.match(r'^[A-Z][A-Za-z0-9]*$', group):
-                        components.add(group)
-            else:
-                # Single match
-                if re.match(r'^[A-Z][A-Za-z0-9]*$', match):
-                    components.add(match)
-    
-    if components:
+    # Each alternative only captures PascalCase names, so the matched group needs no re-check
+    components = {m.group(m.lastindex) for m in EXPORT_RE.finditer(text)}
+    
+    # Runs for every file; only build the message when it will be shown
+    if components and LOG.isEnabledFor(logging.DEBUG):
         LOG.debug(f"Found components via regex: {components}")
     return components